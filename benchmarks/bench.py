@@ -0,0 +1,147 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from types import CodeType
+from typing import Callable
+
+from src.interpreter import Interpreter
+
+WORKLOAD_DIR = os.path.join(os.path.dirname(__file__), 'workloads')
+WORKLOADS = ['nbody', 'fannkuch', 'richards', 'spectral_norm', 'generator_pipeline', 'coroutine_pingpong',
+             'yield_from_chain', 'coroutine_sleep', 'closures']
+
+
+def load(name: str) -> CodeType:
+    path = os.path.join(WORKLOAD_DIR, name + '.py')
+    with open(path, 'r') as infile:
+        return compile(infile.read(), path, 'exec')
+
+
+def run_native(code: CodeType):
+    exec(code, {'__name__': '__main__'})
+
+
+def run_vm(code: CodeType, hook: Callable = None):
+    interpreter = Interpreter()
+    interpreter.hook = hook
+    interpreter.run(code)
+
+
+def capture(run: Callable, code: CodeType) -> str:
+    with contextlib.redirect_stdout(io.StringIO()) as outfile:
+        run(code)
+    return outfile.getvalue()
+
+
+def best_time(run: Callable, code: CodeType, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(code)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def count_instructions(code: CodeType) -> int:
+    # 单独运行一次，计数的 hook 会让求值循环变慢
+    count = 0
+
+    def hook(frame):
+        nonlocal count
+        count += 1
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_vm(code, hook)
+    return count
+
+
+def peak_memory(run: Callable, code: CodeType) -> int:
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(code)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench(name: str, repeat: int) -> dict:
+    code = load(name)
+    # 先各运行一次检查输出一致，同时完成预热
+    matches = capture(run_vm, code) == capture(run_native, code)
+    vm_time = best_time(run_vm, code, repeat)
+    native_time = best_time(run_native, code, repeat)
+    return {
+        'vm_time': vm_time,
+        'native_time': native_time,
+        'slowdown': vm_time / native_time,
+        'instructions': count_instructions(code),
+        'vm_peak_memory': peak_memory(run_vm, code),
+        'native_peak_memory': peak_memory(run_native, code),
+        'output_matches': matches,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    # 返回是否有基准测试变慢超过 threshold
+    regressed = False
+    print('{:<20} {:>12} {:>12} {:>9}'.format('benchmark', 'base (s)', 'now (s)', 'change'))
+    for name, result in results.items():
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            continue
+        change = result['vm_time'] / base['vm_time'] - 1
+        mark = ''
+        if change > threshold:
+            mark = '  REGRESSION'
+            regressed = True
+        print('{:<20} {:>12.3f} {:>12.3f} {:>+8.1%}{}'.format(
+            name, base['vm_time'], result['vm_time'], change, mark))
+    return regressed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('names', nargs='*', metavar='NAME')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in WORKLOADS:
+            parser.error('unknown benchmark {}, choose from {}'.format(name, ', '.join(WORKLOADS)))
+    return args
+
+
+def main():
+    args = parse_args()
+    results = {}
+    print('{:<20} {:>10} {:>10} {:>9} {:>13} {:>12} {:>12}'.format(
+        'benchmark', 'vm (s)', 'native (s)', 'slowdown', 'instructions', 'vm peak', 'native peak'))
+    for name in args.names or WORKLOADS:
+        result = results[name] = bench(name, args.repeat)
+        print('{:<20} {:>10.3f} {:>10.3f} {:>8.1f}x {:>13} {:>11.1f}K {:>11.1f}K{}'.format(
+            name, result['vm_time'], result['native_time'], result['slowdown'], result['instructions'],
+            result['vm_peak_memory'] / 1024, result['native_peak_memory'] / 1024,
+            '' if result['output_matches'] else '  OUTPUT MISMATCH'))
+
+    if args.save:
+        with open(args.save, 'w') as outfile:
+            json.dump({'python': sys.version.split()[0], 'benchmarks': results}, outfile, indent=2)
+    regressed = False
+    if args.compare:
+        with open(args.compare, 'r') as infile:
+            regressed = compare(results, json.load(infile), args.threshold)
+    if regressed or not all(result['output_matches'] for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
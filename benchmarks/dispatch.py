@@ -0,0 +1,70 @@
+import argparse
+import os
+import time
+from types import CodeType
+
+from src.function import CodeFlag
+from src.interpreter import Interpreter
+from src.opcode import OpCode
+
+# (名称, 旧 match 链中的位置, 重复的指令序列)，每个序列都不改变栈深度
+PATTERNS = [
+    ('NOP', 1, [(OpCode.NOP, 0)]),
+    ('DUP_TOP+POP_TOP', 3, [(OpCode.DUP_TOP, 0), (OpCode.POP_TOP, 0)]),
+    ('LOAD_CONST+POP_TOP', 22, [(OpCode.LOAD_CONST, 1), (OpCode.POP_TOP, 0)]),
+    ('LOAD_FAST+POP_TOP', 55, [(OpCode.LOAD_FAST, 0), (OpCode.POP_TOP, 0)]),
+    ('IMPORT_FROM+POP_TOP', 70, [(OpCode.IMPORT_FROM, 0), (OpCode.POP_TOP, 0)]),
+    ('LOAD_CONST+GET_AWAITABLE+POP_TOP', 72,
+     [(OpCode.LOAD_CONST, 2), (OpCode.GET_AWAITABLE, 0), (OpCode.POP_TOP, 0)]),
+]
+
+
+async def idle():
+    pass
+
+
+def make_code(pattern: list[tuple[int, int]], count: int, coro) -> CodeType:
+    # 栈底放一个模块对象供 IMPORT_FROM 使用，GET_AWAITABLE 使用常量中的协程
+    co_code = bytearray([OpCode.LOAD_CONST, 1])
+    for _ in range(count):
+        for opcode, oparg in pattern:
+            co_code += bytes([opcode, oparg])
+    co_code += bytes([OpCode.POP_TOP, 0, OpCode.LOAD_CONST, 0, OpCode.RETURN_VALUE, 0])
+    template = compile('x = None', '<dispatch>', 'exec')
+    return template.replace(
+        co_code=bytes(co_code), co_consts=(None, os, coro), co_names=('path',),
+        co_varnames=('x',), co_nlocals=1, co_flags=CodeFlag.OPTIMIZED | CodeFlag.NEWLOCALS,
+        co_stacksize=4, co_linetable=b'')
+
+
+def bench(code: CodeType, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        interpreter = Interpreter()
+        start = time.perf_counter()
+        interpreter.run(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', type=int, default=20000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print('{:<34} {:>10} {:>14}'.format('pattern', 'chain pos', 'ns/instr'))
+    coro = idle()
+    for name, position, pattern in PATTERNS:
+        code = make_code(pattern, args.count, coro)
+        elapsed = bench(code, args.repeat)
+        ns = elapsed / (args.count * len(pattern)) * 1e9
+        print('{:<34} {:>10} {:>14.1f}'.format(name, position, ns))
+    coro.close()
+
+
+if __name__ == '__main__':
+    main()
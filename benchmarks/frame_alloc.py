@@ -0,0 +1,98 @@
+import argparse
+import sys
+import time
+import tracemalloc
+
+from src.frame import Frame
+from src.interpreter import Interpreter
+
+SOURCE = '''
+def down(n, a, b):
+    if n == 0:
+        return probe()
+    return down(n - 1, a, b)
+
+
+def flat(n):
+    for i in range(n):
+        leaf(i, i)
+
+
+def leaf(x, y):
+    return x
+
+
+class Node:
+    def down(self, n, a, b):
+        if n == 0:
+            return probe()
+        return self.down(n - 1, a, b)
+
+    def leaf(self, x):
+        return x
+
+
+def flat_method(n):
+    node = Node()
+    for i in range(n):
+        node.leaf(i)
+'''
+
+
+def deep_size(obj) -> int:
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def make_interpreter():
+    interpreter = Interpreter()
+    samples = []
+    interpreter.builtins['probe'] = lambda: samples.append(tracemalloc.get_traced_memory()[0])
+    frame = Frame(compile(SOURCE, '<frame_alloc>', 'exec'), builtins=interpreter.builtins)
+    interpreter.eval_frame(frame)
+    interpreter.frame = frame
+    return interpreter, frame.f_globals, samples
+
+
+def per_call_memory(depth: int, method: bool = False) -> float:
+    # 递归到最深处时每个活动调用占用的内存。
+    # 方法调用不创建绑定方法和参数元组，与普通函数调用相同，只有帧
+    _, namespace, samples = make_interpreter()
+    down = namespace['Node']().down if method else namespace['down']
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    down(depth, 1, 2)
+    tracemalloc.stop()
+    return (samples[0] - base) / depth
+
+
+def per_call_time(count: int, method: bool = False) -> float:
+    _, namespace, _ = make_interpreter()
+    start = time.perf_counter()
+    namespace['flat_method' if method else 'flat'](count)
+    return (time.perf_counter() - start) / count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--depth', type=int, default=200)
+    parser.add_argument('-n', '--count', type=int, default=20000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    interpreter, namespace, _ = make_interpreter()
+    frame = interpreter.make_frame(namespace['leaf'], (1, 2))
+    print('Frame object size:        {:>8} bytes'.format(deep_size(frame)))
+    print('Live memory per VM call:  {:>8.0f} bytes'.format(per_call_memory(args.depth)))
+    print('Time per VM call:         {:>8.2f} us'.format(per_call_time(args.count) * 1e6))
+    print('Live memory per method:   {:>8.0f} bytes'.format(per_call_memory(args.depth, method=True)))
+    print('Time per method call:     {:>8.2f} us'.format(per_call_time(args.count, method=True) * 1e6))
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    main()
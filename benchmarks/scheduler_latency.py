@@ -0,0 +1,69 @@
+import argparse
+import time
+
+from src.interpreter import Interpreter
+from src.scheduler import Scheduler, percentiles
+
+SOURCE = '''
+def hog(n):
+    # CPU 密集的任务
+    total = 0
+    for i in range(n):
+        total += i * i % 7
+    return total
+
+
+def request(n):
+    # 对延迟敏感的短任务
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+'''
+
+# 不抢占：每个任务一直运行到结束
+NO_PREEMPTION = 10 ** 12
+
+
+def measure(budget: int, hogs: int, requests: int, hog_size: int, request_size: int) -> tuple[list, float, int]:
+    interpreter = Interpreter()
+    namespace = {}
+    interpreter.builtins['export'] = namespace.update
+    interpreter.run(compile(SOURCE + 'export(hog=hog, request=request)\n', '<scheduler_latency>', 'exec'))
+    scheduler = Scheduler(interpreter, budget)
+    for i in range(hogs):
+        scheduler.spawn(namespace['hog'], hog_size, name='hog-{}'.format(i))
+    short = [scheduler.spawn(namespace['request'], request_size, name='request-{}'.format(i))
+             for i in range(requests)]
+    start = time.perf_counter()
+    scheduler.run()
+    elapsed = time.perf_counter() - start
+    switches = sum(task.slices for task in scheduler.tasks)
+    return [task.turnaround for task in short], elapsed, switches
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budgets', type=int, nargs='+', default=[100, 1000, 10000, NO_PREEMPTION])
+    parser.add_argument('--hogs', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--hog-size', type=int, default=100000)
+    parser.add_argument('--request-size', type=int, default=100)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print('{:>14} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'budget', 'slices', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'total (s)'))
+    for budget in args.budgets:
+        latencies, elapsed, switches = measure(
+            budget, args.hogs, args.requests, args.hog_size, args.request_size)
+        points = percentiles(latencies)
+        print('{:>14} {:>10} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.3f}'.format(
+            budget if budget != NO_PREEMPTION else 'none', switches,
+            points[50] * 1e3, points[90] * 1e3, points[99] * 1e3, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+# 装饰器和嵌套函数：每次调用都创建闭包，闭包通过 nonlocal 修改外层的变量
+def counted(func):
+    calls = 0
+
+    def wrapper(*args):
+        nonlocal calls
+        calls += 1
+        return func(*args)
+    return wrapper
+
+
+def make_adder(n):
+    def add(x):
+        return x + n
+    return add
+
+
+def accumulate(values):
+    total = 0
+
+    def add(value):
+        nonlocal total
+        total += value
+    for value in values:
+        add(value)
+    return total
+
+
+def run(n):
+    result = 0
+    for i in range(n):
+        square = counted(lambda x: x * x)
+        result += make_adder(i)(square(i)) + accumulate((i, 1, 2))
+    return result
+
+
+print(run(20000))
@@ -0,0 +1,33 @@
+# 两个协程通过 await 来回传递一个计数，由外部驱动 send
+import types
+
+
+@types.coroutine
+def switch(ball):
+    reply = yield ball
+    return reply
+
+
+async def hit(ball):
+    return await switch(ball + 1)
+
+
+async def player(n):
+    ball = await switch(0)
+    for i in range(n):
+        ball = await hit(ball)
+
+
+def ping_pong(n):
+    ping = player(n)
+    pong = player(n)
+    ping.send(None)
+    pong.send(None)
+    ball = 0
+    for i in range(n):
+        ball = ping.send(ball)
+        ball = pong.send(ball)
+    return ball
+
+
+print(ping_pong(30000))
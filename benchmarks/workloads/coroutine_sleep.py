@@ -0,0 +1,16 @@
+# 十万个协程在 src.eventloop 上并发 sleep，测量调度和挂起/恢复的开销
+from src.eventloop import gather, run, sleep
+
+
+async def sleeper(i):
+    await sleep(0.001 * (i % 10))
+    await sleep(0)
+    return i
+
+
+async def main(n):
+    results = await gather(*[sleeper(i) for i in range(n)])
+    print(len(results), sum(results))
+
+
+run(main(100000))
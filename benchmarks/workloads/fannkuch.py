@@ -0,0 +1,58 @@
+# 改编自 pyperformance 的 fannkuch，切片翻转改为原地交换
+
+
+def flip(perm, k):
+    i = 0
+    while i < k:
+        perm[i], perm[k] = perm[k], perm[i]
+        i += 1
+        k -= 1
+
+
+def fannkuch(n):
+    count = list(range(1, n + 1))
+    max_flips = 0
+    m = n - 1
+    r = n
+    check = 0
+    perm1 = list(range(n))
+    perm = list(range(n))
+    checksum = 0
+    sign = 1
+    while True:
+        if check < 30:
+            check += 1
+
+        while r != 1:
+            count[r - 1] = r
+            r -= 1
+
+        if perm1[0] != 0:
+            if perm1[m] != m:
+                for i in range(n):
+                    perm[i] = perm1[i]
+                flips = 0
+                k = perm[0]
+                while k != 0:
+                    flip(perm, k)
+                    flips += 1
+                    k = perm[0]
+                if flips > max_flips:
+                    max_flips = flips
+                checksum += sign * flips
+        sign = -sign
+
+        while r != n:
+            perm0 = perm1[0]
+            for i in range(r):
+                perm1[i] = perm1[i + 1]
+            perm1[r] = perm0
+            count[r] -= 1
+            if count[r] > 0:
+                break
+            r += 1
+        else:
+            return checksum, max_flips
+
+
+print(fannkuch(7))
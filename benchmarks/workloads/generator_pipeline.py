@@ -0,0 +1,52 @@
+# 多级生成器管道：产生、过滤、变换、分组、委托
+
+
+def numbers(n):
+    for i in range(n):
+        yield i
+
+
+def evens(source):
+    for x in source:
+        if x % 2 == 0:
+            yield x
+
+
+def squares(source):
+    for x in source:
+        yield x * x
+
+
+def chunks(source, size):
+    chunk = []
+    for x in source:
+        chunk.append(x)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def flatten(source):
+    for chunk in source:
+        yield from chunk
+
+
+def delegate(source, depth):
+    if depth == 0:
+        yield from source
+    else:
+        yield from delegate(source, depth - 1)
+
+
+def main(n):
+    total = 0
+    count = 0
+    for x in delegate(flatten(chunks(squares(evens(numbers(n))), 16)), 4):
+        total += x
+        count += 1
+    print(count, total)
+
+
+main(60000)
@@ -0,0 +1,46 @@
+# 改编自 pyperformance 的 spectral_norm
+
+
+def eval_A(i, j):
+    return 1.0 / ((i + j) * (i + j + 1) // 2 + i + 1)
+
+
+def eval_A_times_u(u):
+    n = len(u)
+    result = []
+    for i in range(n):
+        total = 0.0
+        for j in range(n):
+            total += eval_A(i, j) * u[j]
+        result.append(total)
+    return result
+
+
+def eval_At_times_u(u):
+    n = len(u)
+    result = []
+    for i in range(n):
+        total = 0.0
+        for j in range(n):
+            total += eval_A(j, i) * u[j]
+        result.append(total)
+    return result
+
+
+def eval_AtA_times_u(u):
+    return eval_At_times_u(eval_A_times_u(u))
+
+
+def main(n):
+    u = [1.0] * n
+    for i in range(10):
+        v = eval_AtA_times_u(u)
+        u = eval_AtA_times_u(v)
+    vBv = vv = 0.0
+    for i in range(n):
+        vBv += u[i] * v[i]
+        vv += v[i] * v[i]
+    print(round((vBv / vv) ** 0.5, 9))
+
+
+main(40)
@@ -0,0 +1,22 @@
+# 在 yield_from_basic.py 的基础上，一百万个值穿过 10 层 yield from
+
+
+def source(n):
+    for i in range(n):
+        yield i
+
+
+def relay(inner, depth):
+    if depth == 0:
+        return (yield from inner)
+    return (yield from relay(inner, depth - 1))
+
+
+def main(n, depth):
+    total = 0
+    for x in relay(source(n), depth - 1):
+        total += x
+    print(total)
+
+
+main(1000000, 10)
@@ -0,0 +1,37 @@
+import asyncio
+
+
+class Resource:
+    def __init__(self, name):
+        self.name = name
+
+    async def __aenter__(self):
+        print('open', self.name)
+        await asyncio.sleep(0)
+        return self.name.upper()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        print('close', self.name, exc_type)
+
+
+class Ready:
+    def __init__(self, value):
+        self.value = value
+
+    def __await__(self):
+        yield
+        return self.value
+
+
+async def use(name):
+    async with Resource(name) as handle:
+        value = await Ready(len(handle))
+        print('use', handle, value)
+    return value
+
+
+async def main():
+    print(await asyncio.gather(use('a'), use('bb'), use('ccc')))
+
+
+asyncio.run(main())
@@ -0,0 +1,48 @@
+def counter():
+    n = 0
+
+    def inc():
+        nonlocal n
+        n += 1
+        return n
+
+    def get():
+        return n
+    return inc, get
+
+
+inc, get = counter()
+inc()
+inc()
+print(get())
+
+
+def late():
+    x = 1
+    f = lambda: x
+    x = 2
+    print(f())
+    del x
+    x = 3
+    print(f())
+
+
+late()
+
+
+def deleted():
+    x = ...
+    f = lambda: x
+    print(f())
+    del x
+    try:
+        f()
+    except NameError as ex:
+        print(type(ex).__name__, ex)
+    try:
+        print(x)
+    except NameError as ex:
+        print(type(ex).__name__, ex)
+
+
+deleted()
@@ -0,0 +1,21 @@
+class Version:
+    def __init__(self, n):
+        self.n = n
+
+    def __lt__(self, other):
+        # 富比较可以返回任意对象，条件判断按真值处理
+        return self.n - other.n if self.n < other.n else 0
+
+    def __eq__(self, other):
+        return [self.n] if self.n == other.n else []
+
+
+a, b = Version(1), Version(2)
+if a < b:
+    print('a < b', a < b)
+if not b < a:
+    print('not b < a', b < a)
+if a == Version(1):
+    print('a == 1', a == Version(1))
+while b < a:
+    print('unreachable')
@@ -0,0 +1,12 @@
+def config():
+    return {'depth': 1, 'width': 2}
+
+
+a = config()
+a['depth'] = 10
+b = config()
+print(a, b, a is b)
+
+x, y, z = 1, 2, 3
+x, y, z = [z, x, y]
+print(x, y, z)
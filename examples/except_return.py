@@ -0,0 +1,36 @@
+def plain(x):
+    try:
+        raise KeyError(x)
+    except KeyError:
+        y = x * 2
+        return y
+
+
+def in_loop(items):
+    for item in items:
+        try:
+            return 10 // item
+        except ZeroDivisionError:
+            return 'zero at ' + str(item)
+
+
+def with_finally(x):
+    try:
+        raise ValueError(x)
+    except ValueError as e:
+        return 'caught ' + str(e)
+    finally:
+        print('finally', x)
+
+
+def named(x):
+    try:
+        {}[x]
+    except KeyError as e:
+        return repr(e)
+
+
+print(plain(3))
+print(in_loop([0, 1]))
+print(with_finally(4))
+print(named('k'))
@@ -0,0 +1,39 @@
+class K:
+    def m(self):
+        pass
+
+    def p(self, a, b, /, c):
+        pass
+
+
+def g(a, b=2):
+    pass
+
+
+def h(a, *, k):
+    pass
+
+
+def outer():
+    def inner(x):
+        pass
+    return inner
+
+
+cases = [
+    lambda: K().m(1),
+    lambda: g(1, 2, 3, b=1),
+    lambda: g(1, 2, 3, c=1),
+    lambda: g(b=1),
+    lambda: g(1, a=2),
+    lambda: h(1),
+    lambda: h(1, 2, k=3),
+    lambda: K().p(1, a=1, b=2, c=3),
+    lambda: outer()(),
+    lambda: outer()(1, x=2),
+]
+for case in cases:
+    try:
+        case()
+    except TypeError as e:
+        print(e)
@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import src
+
+# 无限递归在 --max-depth 处停止，而不是耗尽宿主的递归深度
+main = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(src.__file__))), 'main.py')
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'recursion.py')
+    with open(path, 'w') as outfile:
+        outfile.write('def f(n):\n    return f(n + 1)\n\n\nf(0)\n')
+    result = subprocess.run([sys.executable, main, path, '--max-depth', '50', '--no-cache'],
+                            capture_output=True, text=True)
+lines = result.stderr.splitlines()
+print(result.returncode, lines[0], len(lines))
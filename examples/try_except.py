@@ -0,0 +1,53 @@
+def divide(a, b):
+    try:
+        result = a / b
+    except ZeroDivisionError as ex:
+        print('error:', ex)
+        return None
+    else:
+        print('ok')
+        return result
+    finally:
+        print('finally', a, b)
+
+
+print(divide(6, 3))
+print(divide(1, 0))
+
+
+def lookup(mapping, keys):
+    found = []
+    for key in keys:
+        try:
+            found.append(mapping[key])
+        except (KeyError, IndexError):
+            print('missing', key)
+            continue
+        finally:
+            print('checked', key)
+    return found
+
+
+print(lookup({'a': 1, 'b': 2}, ['a', 'x', 'b']))
+
+
+def wrap():
+    try:
+        int('x')
+    except ValueError as ex:
+        raise RuntimeError('bad number') from ex
+
+
+try:
+    wrap()
+except RuntimeError as ex:
+    print(repr(ex), repr(ex.__cause__))
+
+try:
+    try:
+        [][0]
+    except IndexError:
+        print('reraise')
+        raise
+except IndexError as ex:
+    print('outer', ex)
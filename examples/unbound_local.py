@@ -0,0 +1,22 @@
+def maybe(flag):
+    if flag:
+        x = 1
+    return x
+
+
+def deleted():
+    x = 1
+    del x
+    return x
+
+
+def ellipsis():
+    x = ...
+    return x
+
+
+for call in (lambda: maybe(True), lambda: maybe(False), deleted, ellipsis):
+    try:
+        print(call())
+    except UnboundLocalError as ex:
+        print(type(ex).__name__, ex)
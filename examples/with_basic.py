@@ -0,0 +1,25 @@
+class Resource:
+    def __init__(self, name, suppress):
+        self.name = name
+        self.suppress = suppress
+
+    def __enter__(self):
+        print('enter', self.name)
+        return self.name.upper()
+
+    def __exit__(self, exc_type, exc, tb):
+        print('exit', self.name, exc_type, exc)
+        return self.suppress
+
+
+with Resource('a', False) as handle:
+    print('use', handle)
+
+with Resource('b', True):
+    raise KeyError('suppressed')
+
+try:
+    with Resource('c', False), Resource('d', False):
+        1 / 0
+except ZeroDivisionError:
+    print('propagated')
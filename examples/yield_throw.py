@@ -0,0 +1,28 @@
+def inner():
+    try:
+        yield 1
+        yield 2
+    except ValueError as ex:
+        print('inner caught', ex)
+        yield 'recovered'
+    finally:
+        print('inner finally')
+
+
+def outer():
+    try:
+        yield from inner()
+    except KeyError:
+        print('outer caught')
+    yield 'done'
+
+
+gtor = outer()
+print(next(gtor))
+print(gtor.throw(ValueError('boom')))
+print(next(gtor))
+
+gtor = outer()
+print(next(gtor))
+print(gtor.throw(KeyError()))
+gtor.close()
@@ -1,16 +1,28 @@
 import argparse
 from cgitb import enable
 import curses
+import json
 from signal import pause
 import sys
+import time
 
+from src.batch import read_manifest, run_batch
+from src.codecache import CodeCache
+from src.codeinfo import fusion_report
+from src.governor import Limits, ResourceLimitExceeded
 from src.interpreter import Interpreter
+from src.peephole import MAX_LEVEL
+from src.profiler import Profiler
+from src.sampler import Sampler
+from src.specialize import enable_stats, specialization_report
+from src.trace import TraceRecorder, replay
 from src.visualize import draw
+from src.vmtraceback import format_exception
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('filename')
+    parser.add_argument('filename', nargs='?')
     parser.add_argument('-p',
                         '--pause',
                         action='store',
@@ -19,21 +31,187 @@ def parse_args():
     parser.add_argument('--enable-vis',
                         action='store_true',
                         default=False)
-    return parser.parse_args()
+    parser.add_argument('--max-fps',
+                        action='store',
+                        type=float,
+                        default=30)
+    parser.add_argument('--fusion-report',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--specialization-report',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--record-trace',
+                        action='store',
+                        metavar='FILE')
+    parser.add_argument('--trace-snapshot-every',
+                        action='store',
+                        type=int,
+                        default=0,
+                        metavar='N')
+    parser.add_argument('--replay',
+                        action='store',
+                        metavar='FILE')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--profile-json',
+                        action='store',
+                        metavar='FILE')
+    parser.add_argument('--profile-pstats',
+                        action='store',
+                        metavar='FILE')
+    parser.add_argument('--sample',
+                        action='store',
+                        metavar='FILE')
+    parser.add_argument('--sample-rate',
+                        action='store',
+                        type=float,
+                        default=100,
+                        metavar='HZ')
+    parser.add_argument('--cache-dir',
+                        action='store',
+                        metavar='DIR')
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--batch',
+                        action='store',
+                        nargs='+',
+                        default=[],
+                        metavar='FILE')
+    parser.add_argument('--manifest',
+                        action='store',
+                        metavar='FILE')
+    parser.add_argument('-j',
+                        '--jobs',
+                        action='store',
+                        type=int,
+                        metavar='N')
+    parser.add_argument('--max-instructions',
+                        action='store',
+                        type=int,
+                        metavar='N')
+    parser.add_argument('--timeout',
+                        action='store',
+                        type=float,
+                        metavar='SECONDS')
+    parser.add_argument('--max-depth',
+                        action='store',
+                        type=int,
+                        metavar='N')
+    parser.add_argument('--max-stack',
+                        action='store',
+                        type=int,
+                        metavar='N')
+    parser.add_argument('-O',
+                        '--optimize',
+                        action='store',
+                        type=int,
+                        choices=range(MAX_LEVEL + 1),
+                        default=0,
+                        metavar='LEVEL')
+    args = parser.parse_args()
+    if args.filename is None and args.replay is None and not args.batch and args.manifest is None:
+        parser.error('the following arguments are required: filename')
+    return args
+
+
+def make_limits(args) -> Limits:
+    if args.max_instructions is None and args.timeout is None and args.max_depth is None and args.max_stack is None:
+        return None
+    return Limits(args.max_instructions, args.timeout, args.max_depth, args.max_stack)
 
 
 def main():
     args = parse_args()
-    with open(args.filename, 'r') as infile:
-        source = infile.read()
+    if args.replay:
+        curses.wrapper(replay, args.replay)
+        return
+    if args.batch or args.manifest:
+        batch(args)
+        return
+    if args.no_cache:
+        cache = None
+        with open(args.filename, 'r') as infile:
+            code = compile(infile.read(), args.filename, 'exec')
+    else:
+        cache = CodeCache(args.filename, args.cache_dir, args.optimize)
+        code = cache.load()
+    try:
+        run(args, code)
+    except ResourceLimitExceeded as ex:
+        print(ex, file=sys.stderr)
+        sys.exit(1)
+    except Exception as ex:
+        # 未捕获的异常只显示 VM 中的调用栈
+        sys.stderr.write(''.join(format_exception(ex)))
+        sys.exit(1)
+    finally:
+        if cache is not None:
+            cache.save()
+    if args.fusion_report:
+        print(fusion_report(), file=sys.stderr)
+    if args.specialization_report:
+        print(specialization_report(), file=sys.stderr)
+
+
+def batch(args):
+    # 每个脚本输出一行 JSON，按输入顺序流式输出
+    paths = list(args.batch)
+    if args.manifest:
+        paths += read_manifest(args.manifest)
+    start = time.perf_counter()
+    failed = instructions = 0
+    for result in run_batch(paths, args.jobs, args.cache_dir, not args.no_cache, make_limits(args), args.optimize):
+        failed += result['error'] is not None
+        instructions += result['instructions']
+        print(json.dumps(result), flush=True)
+    elapsed = time.perf_counter() - start
+    print('{} scripts, {} failed, {} instructions in {:.2f}s ({:.1f} scripts/s)'.format(
+        len(paths), failed, instructions, elapsed, len(paths) / elapsed), file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
 
-    code = compile(source, args.filename, 'exec')
+def run(args, code):
+    limits = make_limits(args)
+    if args.specialization_report:
+        enable_stats()
     if args.enable_vis:
         drawer = curses.wrapper(draw)
         drawer.send(None)
-        Interpreter(drawer, args.enable_vis, args.pause).run(code)
+        Interpreter(drawer, args.enable_vis, args.pause, args.max_fps, args.optimize).run(code, limits)
+    elif args.record_trace:
+        recorder = TraceRecorder(args.record_trace, args.trace_snapshot_every)
+        interpreter = Interpreter(optimize=args.optimize)
+        interpreter.hook = recorder.record
+        try:
+            interpreter.run(code, limits)
+        finally:
+            recorder.close()
+    elif args.profile or args.profile_json or args.profile_pstats:
+        profiler = Profiler()
+        interpreter = Interpreter(optimize=args.optimize)
+        profiler.attach(interpreter)
+        interpreter.run(code, limits)
+        if args.profile:
+            print(profiler.report(), file=sys.stderr)
+        if args.profile_json:
+            profiler.dump_json(args.profile_json)
+        if args.profile_pstats:
+            profiler.dump_pstats(args.profile_pstats)
+    elif args.sample:
+        interpreter = Interpreter(optimize=args.optimize)
+        sampler = Sampler(interpreter, args.sample_rate)
+        sampler.start()
+        try:
+            interpreter.run(code, limits)
+        finally:
+            sampler.stop()
+            sampler.dump(args.sample)
     else:
-        Interpreter().run(code)
+        Interpreter(optimize=args.optimize).run(code, limits)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,108 @@
+import argparse
+import contextlib
+import difflib
+import glob
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from types import CodeType
+from typing import Callable
+
+from src.codecache import walk
+from src.codeinfo import optimized
+from src.interpreter import Interpreter
+from src.peephole import MAX_LEVEL, stack_depths
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+
+
+def run_native(code: CodeType):
+    exec(code, {'__name__': '__main__'})
+
+
+def run_vm(code: CodeType, optimize: int = 0):
+    Interpreter(optimize=optimize).run(code)
+
+
+def verify(code: CodeType, optimize: int) -> str:
+    # 校验优化后每个代码对象的值栈深度在所有路径上一致，包括运行时没有执行到的代码
+    for child in walk(code):
+        try:
+            stack_depths(optimized(child, optimize)[0])
+        except ValueError as ex:
+            return '<verifier: {} ({}:{}): {}>\n'.format(
+                child.co_name, child.co_filename, child.co_firstlineno, ex)
+    return ''
+
+
+def capture(run: Callable, code: CodeType) -> tuple[str, float]:
+    # 在当前进程中运行，返回标准输出和耗时，异常只记录类型（两边的错误信息不一定相同）
+    outfile = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(outfile):
+        try:
+            run(code)
+        except Exception as ex:
+            print('<raised {}>'.format(type(ex).__name__))
+    return outfile.getvalue(), time.perf_counter() - start
+
+
+def run_example(path: str, optimize: int = 0) -> tuple[str, str, float, float]:
+    with open(path, 'r') as infile:
+        code = compile(infile.read(), path, 'exec')
+    native, native_time = capture(run_native, code)
+    vm, vm_time = capture(partial(run_vm, optimize=optimize), code)
+    if optimize:
+        vm += verify(code, optimize)
+    return native, vm, native_time, vm_time
+
+
+def init_worker():
+    # 与直接运行脚本时相同，示例所在目录位于模块搜索路径的最前面
+    sys.path.insert(0, EXAMPLE_DIR)
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    index, count = map(int, value.split('/'))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError('shard must be I/N with 0 <= I < N')
+    return index, count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1), metavar='I/N')
+    # 用指定的优化级别运行虚拟机，输出必须与 CPython 相同，并校验优化后的指令
+    parser.add_argument('-O', '--optimize', type=int, choices=range(MAX_LEVEL + 1), default=0, metavar='LEVEL')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    files = args.files or sorted(glob.glob(os.path.join(EXAMPLE_DIR, '*.py')))
+    index, count = args.shard
+    files = files[index::count]
+
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(args.jobs, initializer=init_worker) as executor:
+        for path, (native, vm, native_time, vm_time) in zip(files, executor.map(partial(run_example, optimize=args.optimize), files)):
+            ratio = vm_time / native_time if native_time else float('inf')
+            status = 'Pass' if native == vm else 'Failed'
+            print('{} -------------------------------- {} {:>8.1f}x'.format(os.path.basename(path), status, ratio))
+            if native != vm:
+                failed += 1
+                sys.stdout.writelines(difflib.unified_diff(
+                    native.splitlines(True), vm.splitlines(True), 'native', 'vm'))
+    print('{} passed, {} failed in {:.2f}s'.format(len(files) - failed, failed, time.perf_counter() - start))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
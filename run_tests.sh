@@ -4,13 +4,5 @@ python=python3.10
 
 cd $(dirname $0)
 
-files=$(find ./examples -type f -name "*.py" | sort)
-for file in $files; do
-  if test "$($python $file)" == "$($python main.py $file)"; then
-    echo -e "$(basename $file) -------------------------------- Pass"
-  else
-    echo -e "$(basename $file) -------------------------------- Failed"
-  fi
-done
-
-# find . -type d -name "__pycache__" | xargs -i rm -r {}
+# 在进程池中运行每个示例，分别用 CPython 和虚拟机执行并比较输出，参数见 run_tests.py -h
+exec $python run_tests.py "$@"
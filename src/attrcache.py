@@ -0,0 +1,74 @@
+import builtins
+import weakref
+from functools import wraps
+
+from src.function import Function
+
+# 每个调用点最多缓存的接收者类型数，超过后新类型直接走 getattr
+MAX_ENTRIES = 4
+
+# 类 -> 缓存了以它为基类（包括它自己）的类型的缓存。
+# 类被修改时只删除这些缓存中 MRO 包含它的条目，其他调用点的缓存不受影响
+_dependents: 'weakref.WeakKeyDictionary[type, weakref.WeakSet[AttrCache]]' = weakref.WeakKeyDictionary()
+
+
+def invalidate_type(klass: type):
+    caches = _dependents.pop(klass, None)
+    if not caches:
+        return
+    for cache in caches:
+        entries = cache.entries
+        for tp in [tp for tp in entries if klass in tp.__mro__]:
+            del entries[tp]
+
+
+class AttrCache:
+    # LOAD_ATTR/LOAD_METHOD 的内联缓存，以接收者的类型为键。
+    # 值为类上的虚拟机 Function，可以直接绑定而不经过 Function.__get__；
+    # 为 False 表示属性来自实例字典或普通类属性，由 getattr 完成查找
+    __slots__ = ('name', 'entries', '__weakref__')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.entries: dict[type, Function] = {}
+
+    def fill(self, tp: type) -> Function:
+        if len(self.entries) >= MAX_ENTRIES:
+            return False
+        method = self.entries[tp] = classify(tp, self.name)
+        for klass in tp.__mro__:
+            try:
+                _dependents[klass].add(self)
+            except KeyError:
+                _dependents[klass] = weakref.WeakSet([self])
+        return method
+
+    def __repr__(self):
+        return '<AttrCache {} {}>'.format(
+            repr(self.name), [tp.__name__ for tp in self.entries])
+
+
+def classify(tp: type, name: str) -> Function:
+    # 类对象的属性查找规则不同，自定义 __getattribute__ 或没有实例字典的类型也不缓存
+    if (issubclass(tp, type) or not tp.__dictoffset__
+            or tp.__getattribute__ is not object.__getattribute__):
+        return False
+    for klass in tp.__mro__:
+        if name in klass.__dict__:
+            value = klass.__dict__[name]
+            return value if isinstance(value, Function) else False
+    return False
+
+
+@wraps(builtins.setattr)
+def setattr_(obj, name, value):
+    builtins.setattr(obj, name, value)
+    if isinstance(obj, type):
+        invalidate_type(obj)
+
+
+@wraps(builtins.delattr)
+def delattr_(obj, name):
+    builtins.delattr(obj, name)
+    if isinstance(obj, type):
+        invalidate_type(obj)
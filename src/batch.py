@@ -0,0 +1,117 @@
+import contextlib
+import io
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import count
+from typing import Iterator
+
+from src.codecache import CodeCache
+from src.governor import Limits, ResourceLimitExceeded
+from src.interpreter import Interpreter
+from src.vmtraceback import format_exception
+
+# 工作进程中常驻的解释器，多个脚本之间复用内置命名空间、属性缓存和空闲帧
+_interpreter: Interpreter = None
+_builtins: dict = None
+_builtins_version = 0
+_cache_dir: str = None
+_use_cache = True
+_limits: Limits = None
+_optimize = 0
+
+
+def read_manifest(path: str) -> list[str]:
+    # 每行一个脚本路径，忽略空行和 # 开头的注释，相对路径相对于清单文件所在目录
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r') as infile:
+        lines = [line.strip() for line in infile]
+    return [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+
+def init_worker(cache_dir: str, use_cache: bool, limits: Limits, optimize: int):
+    global _interpreter, _builtins, _builtins_version, _cache_dir, _use_cache, _limits, _optimize
+    _interpreter = Interpreter(optimize=optimize)
+    _builtins = dict(_interpreter.builtins)
+    _builtins_version = _interpreter.builtins.version
+    _cache_dir = cache_dir
+    _use_cache = use_cache
+    _limits = limits
+    _optimize = optimize
+
+
+def load(path: str):
+    if not _use_cache:
+        with open(path, 'r') as infile:
+            return None, compile(infile.read(), path, 'exec')
+    cache = CodeCache(path, _cache_dir, _optimize)
+    return cache, cache.load()
+
+
+def reset(interpreter: Interpreter):
+    # 每个脚本使用新的全局命名空间（Interpreter.run 为模块帧新建），这里只需要清理解释器上的状态。
+    # 内置命名空间被脚本修改过（版本号变化）时恢复原样，恢复后版本号再次改变，相关的内联缓存随之失效
+    global _builtins_version
+    interpreter.frame = None
+    interpreter.exc_info = None
+    interpreter.return_value = None
+    interpreter.delegate = None
+    interpreter.hook = None
+    builtins = interpreter.builtins
+    if builtins.version != _builtins_version:
+        builtins.clear()
+        builtins.update(_builtins)
+        _builtins_version = builtins.version
+
+
+def run_script(path: str) -> dict:
+    interpreter = _interpreter
+    result = {'path': path, 'stdout': '', 'error': None, 'time': 0.0, 'instructions': 0}
+    try:
+        cache, code = load(path)
+    except (OSError, SyntaxError, ValueError) as ex:
+        result['error'] = ''.join(traceback.format_exception_only(type(ex), ex))
+        return result
+    # partial(next, counter)(frame) 即 next(counter, frame)，整个 hook 在 C 中执行，计数几乎没有开销。
+    # 有资源限制时由 Governor 计数
+    counter = count()
+    if _limits is None:
+        interpreter.hook = partial(next, counter)
+    argv, path0 = sys.argv, sys.path[0]
+    sys.argv = [path]
+    sys.path[0] = os.path.dirname(os.path.abspath(path))
+    outfile = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(outfile):
+            interpreter.run(code, _limits)
+    except SystemExit as ex:
+        if ex.code not in (None, 0):
+            result['error'] = 'SystemExit: {}\n'.format(ex.code)
+    except ResourceLimitExceeded as ex:
+        # 宿主调用栈没有意义，异常本身带有 VM 的帧链
+        result['error'] = ''.join(traceback.format_exception_only(type(ex), ex))
+    except Exception as ex:
+        result['error'] = ''.join(format_exception(ex))
+    finally:
+        result['time'] = time.perf_counter() - start
+        result['instructions'] = next(counter) if _limits is None else interpreter.governor.instructions
+        sys.argv = argv
+        sys.path[0] = path0
+        reset(interpreter)
+    result['stdout'] = outfile.getvalue()
+    if cache is not None:
+        cache.save()
+    return result
+
+
+def run_batch(paths: list[str], jobs: int = None, cache_dir: str = None,
+              use_cache: bool = True, limits: Limits = None, optimize: int = 0) -> Iterator[dict]:
+    # 按输入顺序逐个产出结果；脚本很多时成批分发给工作进程，减少进程间通信的次数
+    jobs = jobs or os.cpu_count()
+    chunksize = max(1, min(32, len(paths) // (jobs * 4)))
+    with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(cache_dir, use_cache, limits, optimize)) as executor:
+        yield from executor.map(run_script, paths, chunksize=chunksize)
@@ -0,0 +1,87 @@
+import hashlib
+import marshal
+import os
+import sys
+from types import CodeType
+from typing import Iterator
+
+from src import codeinfo, opcode, peephole
+
+CACHE_SUFFIX = '.toyvm'
+
+
+def vm_version() -> str:
+    # 分析结果取决于 codeinfo、opcode 和 peephole 中的解码、优化、合并规则，这些文件变化时缓存自动失效
+    digest = hashlib.sha1()
+    for module in (codeinfo, opcode, peephole):
+        with open(module.__file__, 'rb') as infile:
+            digest.update(infile.read())
+    return digest.hexdigest()
+
+
+def walk(code: CodeType) -> Iterator[CodeType]:
+    # 深度优先遍历嵌套的代码对象，保存和读取时的顺序一致
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            yield from walk(const)
+
+
+class CodeCache:
+    # 缓存文件内容：(键, 代码对象, 与 walk 顺序对应的 analyze 结果，没有创建过 CodeInfo 的代码对象为 None)
+
+    def __init__(self, filename: str, cache_dir: str = None, optimize: int = 0) -> None:
+        self.filename = filename
+        # 分析结果包含优化后的指令，不同优化级别的缓存互不通用
+        self.optimize = optimize
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), '__pycache__')
+        name = os.path.splitext(os.path.basename(filename))[0]
+        self.path = os.path.join(cache_dir, '{}.{}{}'.format(name, sys.implementation.cache_tag, CACHE_SUFFIX))
+        self.code = None
+        self.source_key = None
+        # 从缓存中读到分析结果的代码对象个数
+        self.cached = 0
+
+    def key(self, source: str) -> tuple:
+        return (hashlib.sha256(source.encode()).hexdigest(), self.filename, vm_version(), sys.version, self.optimize)
+
+    def load(self) -> CodeType:
+        with open(self.filename, 'r') as infile:
+            source = infile.read()
+        key = self.key(source)
+        try:
+            with open(self.path, 'rb') as infile:
+                # marshal.load 直接读文件对象时逐项读取，非常慢
+                cached_key, code, analyses = marshal.loads(infile.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            cached_key = None
+        if cached_key == key:
+            for child, analysis in zip(walk(code), analyses):
+                if analysis is not None:
+                    codeinfo.cached_analyses[child] = analysis
+                    self.cached += 1
+        else:
+            code = compile(source, self.filename, 'exec')
+        self.source_key = key
+        self.code = code
+        return code
+
+    def save(self):
+        # 运行结束后保存，只包含用到过的代码对象，没有新内容时不重写
+        codes = list(walk(self.code))
+        analyzed = [codeinfo.is_analyzed(child) for child in codes]
+        if sum(analyzed) == self.cached:
+            return
+        analyses = [
+            codeinfo.to_portable(codeinfo.analyze(child, self.optimize)) if done else None
+            for child, done in zip(codes, analyzed)]
+        data = marshal.dumps((self.source_key, self.code, analyses))
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp = '{}.{}'.format(self.path, os.getpid())
+            with open(temp, 'wb') as outfile:
+                outfile.write(data)
+            os.replace(temp, self.path)
+        except OSError:
+            pass
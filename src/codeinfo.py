@@ -0,0 +1,293 @@
+import weakref
+from collections import Counter
+from dataclasses import dataclass
+from types import CodeType
+
+from src.attrcache import AttrCache
+from src.function import UNBOUND, BindingPlan, CodeFlag
+from src.namespace import GlobalCache, NameCache
+from src.opcode import (BINARY_SUPERINSTRUCTIONS, BLOCK_POP, BLOCK_SETUP,
+                        FUSABLE_BINARY, HAS_JABS, HAS_JREL, JUMPS, OPNAMES,
+                        SUPERINSTRUCTIONS, TERMINATORS, UNCONDITIONAL_JUMPS,
+                        OpCode, stack_effect)
+from src.peephole import optimize, parameter_count, successors
+from src.specialize import ADAPTIVE_OPCODES, AdaptiveCache
+
+
+def decode(code: CodeType) -> tuple[list[tuple[int, int]], list[int]]:
+    # EXTENDED_ARG 合并进参数，跳转参数转换为指令下标
+    co_code = code.co_code
+    instrs: list[tuple[int, int]] = []
+    offsets: list[int] = []
+    # 字节偏移 -> 指令下标，EXTENDED_ARG 前缀映射到它所扩展的指令
+    index_of: dict[int, int] = {}
+    extended_arg = 0
+    for offset in range(0, len(co_code), 2):
+        opcode, oparg = co_code[offset], co_code[offset + 1] | extended_arg
+        index_of[offset] = len(instrs)
+        if opcode == OpCode.EXTENDED_ARG:
+            extended_arg = oparg << 8
+            continue
+        extended_arg = 0
+        instrs.append((opcode, oparg))
+        offsets.append(offset)
+
+    for i, (opcode, oparg) in enumerate(instrs):
+        if opcode in HAS_JREL:
+            instrs[i] = (opcode, index_of[offsets[i] + 2 + (oparg << 1)])
+        elif opcode in HAS_JABS:
+            instrs[i] = (opcode, index_of[oparg << 1])
+    return instrs, offsets
+
+
+# 与 CPython 相同，异常处理块（except/finally 的处理代码）执行期间位于块栈上的伪块
+EXCEPT_HANDLER = 257
+
+
+@dataclass(frozen=True, slots=True)
+class Block:
+    # type 为 SETUP_FINALLY（包括 with 的清理代码）或 EXCEPT_HANDLER，level 为进入块时的值栈深度
+    type: int
+    handler: int
+    level: int
+
+
+def block_table(instrs: list[tuple[int, int]]) -> list[tuple[Block, ...]]:
+    # 在运行前计算每条指令所在的块栈（从外到内），代替运行时的 SETUP_FINALLY/POP_BLOCK。
+    # instrs 为优化之后、合并超级指令之前的指令。
+    # 沿控制流传播 (值栈深度, 块栈)，进入处理代码时与 CPython 展开时相同：
+    # 值栈恢复到块的深度，压入 EXCEPT_HANDLER 伪块和 6 个值（之前的异常和新异常各 3 个）。
+    # 不可达的指令为 None
+    table: list[tuple[Block, ...]] = [None] * len(instrs)
+    # 生成器开始执行时栈上有 send 的值，由 GEN_START 弹出
+    start_depth = 1 if instrs and instrs[0][0] == OpCode.GEN_START else 0
+    pending = [(0, start_depth, ())]
+    while pending:
+        i, depth, blocks = pending.pop()
+        while i < len(instrs) and table[i] is None:
+            table[i] = blocks
+            opcode, oparg = instrs[i]
+            if opcode in BLOCK_SETUP:
+                # SETUP_WITH 用 __exit__ 替换了上下文管理器，SETUP_ASYNC_WITH 的块不包括 __aenter__ 的结果
+                level = depth + stack_effect(opcode, 0, jump=False) - 1 if opcode != OpCode.SETUP_FINALLY else depth
+                pending.append((oparg, level + 6, blocks + (Block(EXCEPT_HANDLER, -1, level),)))
+                blocks += (Block(OpCode.SETUP_FINALLY, oparg, level),)
+                depth += stack_effect(opcode, 0, jump=False)
+            elif opcode in BLOCK_POP:
+                blocks = blocks[:-1]
+                depth += stack_effect(opcode, 0)
+            elif opcode in JUMPS:
+                pending.append((oparg, depth + stack_effect(opcode, 0, jump=True), blocks))
+                if opcode in UNCONDITIONAL_JUMPS:
+                    break
+                depth += stack_effect(opcode, 0, jump=False)
+            elif opcode in TERMINATORS:
+                break
+            else:
+                depth += stack_effect(opcode, oparg)
+            i += 1
+    return table
+
+
+def attach_caches(code: CodeType, instrs: list[tuple[int, int]], optimize: int = 0):
+    # 用内联缓存替换名字查找指令和 MAKE_FUNCTION 的参数
+    for i, (opcode, oparg) in enumerate(instrs):
+        if opcode == OpCode.MAKE_FUNCTION:
+            instrs[i] = (opcode, FunctionCache(oparg, optimize))
+        elif opcode == OpCode.LOAD_GLOBAL:
+            instrs[i] = (opcode, GlobalCache(code.co_names[oparg]))
+        elif opcode == OpCode.LOAD_NAME:
+            instrs[i] = (opcode, NameCache(code.co_names[oparg]))
+        elif opcode in (OpCode.LOAD_ATTR, OpCode.LOAD_METHOD):
+            instrs[i] = (opcode, AttrCache(code.co_names[oparg]))
+
+
+def fuse(instrs: list[tuple[int, int]]) -> Counter:
+    # 把常见的相邻指令对改写为超级指令，返回每种合并发生的次数。
+    # 第二条指令保持原样，跳转到它的指令依然正确
+    fusions = Counter()
+    i = 0
+    while i < len(instrs) - 1:
+        (first, a), (second, b) = instrs[i], instrs[i + 1]
+        superop = SUPERINSTRUCTIONS.get((first, second))
+        if superop is None:
+            i += 1
+            continue
+        if second in FUSABLE_BINARY:
+            b = FUSABLE_BINARY[second]
+        instrs[i] = (superop, (a, b))
+        fusions[OPNAMES[first], OPNAMES[second]] += 1
+        i += 2
+    return fusions
+
+
+def optimized(code: CodeType, level: int) -> tuple[list[tuple[int, int]], list[int]]:
+    instrs, offsets = decode(code)
+    instrs, offsets, _ = optimize(code, instrs, offsets, level)
+    return instrs, offsets
+
+
+def check_unbound(code: CodeType, instrs: list[tuple[int, int]]):
+    # 确定赋值分析：每条指令执行前一定已经赋值的局部变量（位掩码），
+    # 读取可能未赋值的变量的 LOAD_FAST 改写为 LOAD_FAST_CHECK，其余的 LOAD_FAST 不需要检查。
+    # 处理代码的入口取建立块时的集合，再去掉所有被删除过的变量（try 中的任何位置都可能抛出异常）
+    deleted = 0
+    for opcode, oparg in instrs:
+        if opcode == OpCode.DELETE_FAST:
+            deleted |= 1 << oparg
+    assigned: list[int] = [None] * len(instrs)
+    pending = [(0, (1 << parameter_count(code)) - 1)]
+    while pending:
+        i, mask = pending.pop()
+        if i >= len(instrs):
+            continue
+        if assigned[i] is not None:
+            if assigned[i] & mask == assigned[i]:
+                continue
+            mask &= assigned[i]
+        assigned[i] = mask
+        opcode, oparg = instrs[i]
+        if opcode in BLOCK_SETUP:
+            pending.append((oparg, mask & ~deleted))
+            pending.append((i + 1, mask))
+            continue
+        if opcode == OpCode.STORE_FAST:
+            mask |= 1 << oparg
+        elif opcode == OpCode.DELETE_FAST:
+            mask &= ~(1 << oparg)
+        for target, _ in successors(instrs, i):
+            pending.append((target, mask))
+    for i, (opcode, oparg) in enumerate(instrs):
+        if opcode == OpCode.LOAD_FAST and assigned[i] is not None and not assigned[i] >> oparg & 1:
+            instrs[i] = (OpCode.LOAD_FAST_CHECK, oparg)
+
+
+def analyze(code: CodeType, level: int = 0) -> tuple[list, list[int], Counter]:
+    # 只依赖代码对象本身和优化级别的部分，可以保存到磁盘缓存。
+    # 合并的指令对都不含带内联缓存的指令，所以可以在 attach_caches 之前合并
+    instrs, offsets = optimized(code, level)
+    check_unbound(code, instrs)
+    fusions = fuse(instrs)
+    return instrs, offsets, fusions
+
+
+def to_portable(analysis: tuple[list, list[int], Counter]) -> tuple:
+    # 转换为 marshal 可以保存的形式，二元运算超级指令的运算函数由下一条指令恢复
+    instrs, offsets, fusions = analysis
+    instrs = [
+        (int(opcode), (oparg[0], None) if opcode in BINARY_SUPERINSTRUCTIONS else oparg)
+        for opcode, oparg in instrs]
+    return instrs, offsets, dict(fusions)
+
+
+def from_portable(analysis: tuple) -> tuple[list, list[int], Counter]:
+    instrs, offsets, fusions = analysis
+    for i, (opcode, oparg) in enumerate(instrs):
+        if opcode in BINARY_SUPERINSTRUCTIONS:
+            instrs[i] = (opcode, (oparg[0], FUSABLE_BINARY[instrs[i + 1][0]]))
+    return instrs, offsets, Counter(fusions)
+
+
+def make_adaptive(instrs: list[tuple[int, int]]):
+    # 在合并超级指令之后进行，可以特化的指令（包括超级指令）改写为 ADAPTIVE
+    for i, (opcode, oparg) in enumerate(instrs):
+        if opcode in ADAPTIVE_OPCODES:
+            instrs[i] = (OpCode.ADAPTIVE, AdaptiveCache(opcode, oparg))
+
+
+class CodeInfo:
+    def __init__(self, code: CodeType, optimize: int = 0) -> None:
+        self.code = code
+        self.optimize = optimize
+        analysis = cached_analyses.pop(code, None)
+        if analysis is None:
+            self.instrs, self.offsets, self.fusions = analyze(code, optimize)
+        else:
+            self.instrs, self.offsets, self.fusions = from_portable(analysis)
+        attach_caches(code, self.instrs, optimize)
+        make_adaptive(self.instrs)
+        self.binding = BindingPlan(code)
+        # 创建帧时用到的布局信息
+        self.newlocals = bool(code.co_flags & CodeFlag.NEWLOCALS)
+        self.nlocals = len(code.co_varnames) if self.newlocals else 0
+        self.unbound_locals = (UNBOUND,) * self.nlocals
+        self.ncells = len(code.co_cellvars)
+        self.unbound_cells = (UNBOUND,) * self.ncells
+        # (闭包下标, 快速局部变量下标)，作为单元变量的参数，创建帧时把参数的值放进新建的单元。
+        # 与 CPython 的 *_DEREF 参数相同，闭包中单元变量在前，自由变量在后
+        self.cell_args = tuple(
+            (i, code.co_varnames.index(name))
+            for i, name in enumerate(code.co_cellvars)
+            if name in code.co_varnames)
+        # 正常返回的帧可以复用，生成器和协程的帧由其对象持有
+        self.recyclable = self.newlocals and not code.co_flags & (
+            CodeFlag.GENERATOR | CodeFlag.COROUTINE
+            | CodeFlag.ITERABLE_COROUTINE | CodeFlag.ASYNC_GENERATOR)
+        self.free_frames = []
+        # 第一次有异常经过这个代码对象的帧时才计算
+        self._blocks = None
+
+    @property
+    def blocks(self) -> list[tuple[Block, ...]]:
+        if self._blocks is None:
+            self._blocks = block_table(optimized(self.code, self.optimize)[0])
+        return self._blocks
+
+    def __repr__(self):
+        return '<CodeInfo {}>'.format(repr(self.code.co_name))
+
+
+_code_infos: 'weakref.WeakKeyDictionary[CodeType, CodeInfo]' = weakref.WeakKeyDictionary()
+# 从磁盘缓存读取的 analyze 结果（to_portable 的形式），创建 CodeInfo 时取出
+cached_analyses: 'weakref.WeakKeyDictionary[CodeType, tuple]' = weakref.WeakKeyDictionary()
+
+
+def get_code_info(code: CodeType, optimize: int = 0) -> CodeInfo:
+    # 优化级别只在第一次为代码对象创建 CodeInfo 时生效
+    try:
+        return _code_infos[code]
+    except KeyError:
+        info = _code_infos[code] = CodeInfo(code, optimize)
+        return info
+
+
+class FunctionCache:
+    # MAKE_FUNCTION 的内联缓存，flags 为原来的参数。
+    # 记住上次创建的函数的代码对象和它的 CodeInfo，创建函数时不再查找弱引用字典；
+    # 嵌套函数使用与外层代码相同的优化级别
+    __slots__ = ('flags', 'optimize', 'code', 'info')
+
+    def __init__(self, flags: int, optimize: int) -> None:
+        self.flags = flags
+        self.optimize = optimize
+        self.code = None
+        self.info = None
+
+    def fill(self, code: CodeType) -> CodeInfo:
+        self.code = code
+        self.info = get_code_info(code, self.optimize)
+        return self.info
+
+    def __repr__(self):
+        return '<FunctionCache {}>'.format(self.flags)
+
+
+def is_analyzed(code: CodeType) -> bool:
+    return code in _code_infos or code in cached_analyses
+
+
+def fusion_report() -> str:
+    total = Counter()
+    lines = []
+    for info in list(_code_infos.values()):
+        if not info.fusions:
+            continue
+        total.update(info.fusions)
+        lines.append('{} ({}:{})'.format(
+            info.code.co_name, info.code.co_filename, info.code.co_firstlineno))
+        for (first, second), count in info.fusions.most_common():
+            lines.append('    {:<20} {:<20} {:>6}'.format(first, second, count))
+    lines.append('Total')
+    for (first, second), count in total.most_common():
+        lines.append('    {:<20} {:<20} {:>6}'.format(first, second, count))
+    return '\n'.join(lines)
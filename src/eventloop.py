@@ -0,0 +1,250 @@
+import heapq
+import time
+from collections import deque
+from itertools import count
+from typing import Any, Coroutine
+
+# 正在运行的事件循环，create_task 和 gather 通过它创建任务
+_running_loop = None
+
+
+class CancelledError(BaseException):
+    pass
+
+
+class Sleep:
+    # 协程 await 时把自己产出给事件循环，被唤醒后再次恢复时结束并返回 result。
+    # 直接实现迭代器协议，每次 sleep 不需要额外创建一个生成器
+    __slots__ = ('delay', 'result', 'yielded')
+
+    def __init__(self, delay: float, result: Any) -> None:
+        self.delay = delay
+        self.result = result
+        self.yielded = False
+
+    def __await__(self) -> 'Sleep':
+        return self
+
+    def __iter__(self) -> 'Sleep':
+        return self
+
+    def __next__(self) -> 'Sleep':
+        if self.yielded:
+            raise StopIteration(self.result)
+        self.yielded = True
+        return self
+
+    def send(self, value: Any) -> 'Sleep':
+        return self.__next__()
+
+
+class Task:
+    __slots__ = ('coro', 'loop', 'done', 'result', 'exception', 'waiters', 'waiting', 'cancelling')
+
+    def __init__(self, coro: Coroutine, loop: 'EventLoop') -> None:
+        self.coro = coro
+        self.loop = loop
+        self.done = False
+        self.result = None
+        self.exception = None
+        # 等待这个任务结束的其他任务
+        self.waiters = []
+        # 当前在等待的对象（Sleep、Task 或 asyncio.Future），唤醒时只有和它一致才有效，过期的定时器直接丢弃
+        self.waiting = None
+        self.cancelling = False
+
+    def __await__(self):
+        if not self.done:
+            yield self
+        return self.get_result()
+
+    def get_result(self) -> Any:
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+    def cancel(self) -> bool:
+        if self.done:
+            return False
+        self.cancelling = True
+        if self.waiting is not None:
+            self.waiting = None
+            self.loop.ready.append(self)
+        return True
+
+    def finish(self, result: Any, exception: BaseException):
+        self.done = True
+        self.result = result
+        self.exception = exception
+        ready = self.loop.ready
+        for waiter in self.waiters:
+            if waiter.waiting is self:
+                waiter.waiting = None
+                ready.append(waiter)
+        self.waiters = None
+
+
+class EventLoop:
+
+    def __init__(self) -> None:
+        self.ready = deque()
+        # (到期时间, 序号, 任务, Sleep) 组成的最小堆，序号保证同一时间到期的任务按加入顺序唤醒
+        self.timers = []
+        self.sequence = count()
+        # 在 asyncio 中运行时等待宿主 Future 或定时器，独立运行时为 None
+        self.wakeup = None
+        self.host_waiting = 0
+
+    def create_task(self, coro: Coroutine) -> Task:
+        task = Task(coro, self)
+        self.ready.append(task)
+        return task
+
+    def step(self, task: Task):
+        try:
+            if task.cancelling:
+                task.cancelling = False
+                request = task.coro.throw(CancelledError())
+            else:
+                request = task.coro.send(None)
+        except StopIteration as ex:
+            task.finish(ex.value, None)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except BaseException as ex:
+            task.finish(None, ex)
+        else:
+            self.suspend(task, request)
+
+    def suspend(self, task: Task, request: Any):
+        if request is None:
+            self.ready.append(task)
+        elif type(request) is Sleep:
+            if request.delay <= 0:
+                self.ready.append(task)
+            else:
+                task.waiting = request
+                heapq.heappush(self.timers, (time.monotonic() + request.delay, next(self.sequence), task, request))
+        elif type(request) is Task:
+            if request.done:
+                self.ready.append(task)
+            else:
+                task.waiting = request
+                request.waiters.append(task)
+        elif getattr(request, '_asyncio_future_blocking', False) and self.wakeup is not None:
+            # 与 asyncio.Task 相同的协议：Future.__await__ 产出自己并设置 _asyncio_future_blocking
+            request._asyncio_future_blocking = False
+            task.waiting = request
+            self.host_waiting += 1
+            request.add_done_callback(lambda future: self.host_done(task, future))
+        else:
+            task.coro.close()
+            task.finish(None, RuntimeError('Task got bad yield: {!r}'.format(request)))
+
+    def host_done(self, task: Task, future: Any):
+        self.host_waiting -= 1
+        if task.waiting is future:
+            task.waiting = None
+            self.ready.append(task)
+        self.wakeup.set()
+
+    def run_once(self):
+        ready = self.ready
+        timers = self.timers
+        if timers:
+            now = time.monotonic()
+            while timers and timers[0][0] <= now:
+                _, _, task, sleep = heapq.heappop(timers)
+                if task.waiting is sleep:
+                    task.waiting = None
+                    ready.append(task)
+        # 只运行这一轮开始时已经就绪的任务，本轮中重新就绪的留到下一轮，定时器不会被饿死
+        for _ in range(len(ready)):
+            self.step(ready.popleft())
+
+    def timeout(self) -> float:
+        if self.ready:
+            return 0
+        timers = self.timers
+        # 被取消的任务留下的定时器已经过期，不需要等待
+        while timers and timers[0][2].waiting is not timers[0][3]:
+            heapq.heappop(timers)
+        if timers:
+            return max(timers[0][0] - time.monotonic(), 0)
+        return None
+
+    def run(self, coro: Coroutine) -> Any:
+        global _running_loop
+        task = self.create_task(coro)
+        previous, _running_loop = _running_loop, self
+        try:
+            while True:
+                self.run_once()
+                if task.done:
+                    break
+                timeout = self.timeout()
+                if timeout is None:
+                    raise RuntimeError('Event loop stopped before task completed')
+                if timeout:
+                    time.sleep(timeout)
+        finally:
+            _running_loop = previous
+        return task.get_result()
+
+    async def run_async(self, coro: Coroutine) -> Any:
+        # 作为一个 asyncio 协程运行，空闲时把控制权交给 asyncio，VM 中的协程可以直接 await asyncio 的 Future
+        import asyncio
+
+        global _running_loop
+        task = self.create_task(coro)
+        self.wakeup = asyncio.Event()
+        previous = _running_loop
+        try:
+            while True:
+                _running_loop = self
+                self.run_once()
+                _running_loop = previous
+                if task.done:
+                    break
+                timeout = self.timeout()
+                if timeout == 0:
+                    await asyncio.sleep(0)
+                    continue
+                if timeout is None and not self.host_waiting:
+                    raise RuntimeError('Event loop stopped before task completed')
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+        finally:
+            _running_loop = previous
+        return task.get_result()
+
+
+def get_running_loop() -> EventLoop:
+    if _running_loop is None:
+        raise RuntimeError('no running event loop')
+    return _running_loop
+
+
+def run(coro: Coroutine) -> Any:
+    return EventLoop().run(coro)
+
+
+async def run_async(coro: Coroutine) -> Any:
+    return await EventLoop().run_async(coro)
+
+
+def sleep(delay: float, result: Any = None) -> Sleep:
+    return Sleep(delay, result)
+
+
+def create_task(coro: Coroutine) -> Task:
+    return get_running_loop().create_task(coro)
+
+
+async def gather(*aws: Any) -> list:
+    loop = get_running_loop()
+    tasks = [aw if isinstance(aw, Task) else loop.create_task(aw) for aw in aws]
+    return [await task for task in tasks]
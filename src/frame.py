@@ -1,15 +1,9 @@
-from dataclasses import dataclass
 from types import CodeType
 from typing import Any
 
-from src.function import Cell, CodeFlag
-
-
-@dataclass
-class Block:
-    type: int
-    target: int
-    level: int
+from src.codeinfo import CodeInfo, get_code_info
+from src.function import Cell
+from src.namespace import Namespace
 
 
 class FrameState:
@@ -22,37 +16,63 @@ class FrameState:
     CLEARED = 4
 
 
+# 每个代码对象最多缓存的空闲帧数
+MAX_FREE_FRAMES = 8
+
+
 class Frame:
+    __slots__ = ('f_back', 'f_code', 'f_code_info', 'f_instrs', 'f_builtins', 'f_locals',
+                 'f_globals', 'f_stack', 'f_fast_locals', 'f_closure', 'f_lasti', 'f_state')
 
     def __init__(self, code: CodeType,
                  back: 'Frame' = None,
-                 globals: dict[str, Any] = None,
+                 globals: Namespace = None,
                  args: tuple[Any] = (),
-                 defaults: tuple[Any] = (),
-                 builtins: dict[str, Any] = None,
-                 closure: tuple[Cell] = ()) -> None:
-        self.f_back = back
+                 builtins: Namespace = None,
+                 closure: tuple[Cell] = (),
+                 code_info: CodeInfo = None) -> None:
         self.f_code = code
-        self.f_builtins = builtins
-        self.f_locals: dict[str, Any] = {}
-        # First frame.
-        self.f_globals = globals if globals is not None else self.f_locals
+        self.f_code_info = code_info if code_info is not None else get_code_info(code)
+        self.f_instrs = self.f_code_info.instrs
         self.f_stack: list[Any] = []
-        self.f_loop_stack: list[Any] = []
-        self.f_fast_locals = [*args, *defaults[len(args) - code.co_argcount + 1:]]
-        if self.code.co_flags & CodeFlag.NEWLOCALS:
-            for _ in range(len(self.code.co_varnames) - len(self.f_fast_locals)):
-                self.f_fast_locals.append(...)
-        self.f_closure = [... for _ in range(len(code.co_freevars) + len(code.co_cellvars))]
-        assert len(closure) == len(code.co_freevars)
-        for i, c in enumerate(closure):
-            self.f_closure[i] = c
-        for i, name in enumerate(code.co_cellvars, len(code.co_freevars)):
-            if name in code.co_varnames:
-                self.f_closure[i] = Cell(self.f_fast_locals[code.co_varnames.index(name)])
+        self.f_fast_locals: list[Any] = []
+        self.setup(back, globals, args, builtins, closure)
+
+    def setup(self, back: 'Frame', globals: Namespace, args: tuple[Any],
+              builtins: Namespace, closure: tuple[Cell]):
+        # 新建的帧和从空闲列表中取出的帧共用
+        info = self.f_code_info
+        self.f_back = back
+        self.f_builtins = builtins
+        if info.newlocals:
+            self.f_locals = None
+            self.f_globals = globals
+        else:
+            self.f_locals = Namespace()
+            # First frame.
+            self.f_globals = globals if globals is not None else self.f_locals
+        fast_locals = self.f_fast_locals
+        fast_locals[:] = args
+        if len(fast_locals) < info.nlocals:
+            fast_locals.extend(info.unbound_locals[len(fast_locals):])
+        if info.ncells:
+            # 每次调用新建单元变量的单元，之后 STORE_DEREF 只修改单元中的值
+            self.f_closure = f_closure = [*map(Cell, info.unbound_cells), *closure]
+            for i, j in info.cell_args:
+                f_closure[i].value = fast_locals[j]
+        else:
+            self.f_closure = closure
         self.f_lasti = 0
         self.f_state = FrameState.CREATED
 
+    def clear(self):
+        # 放回空闲列表之前释放所有引用
+        self.f_back = self.f_builtins = self.f_locals = self.f_globals = None
+        self.f_stack.clear()
+        self.f_fast_locals.clear()
+        self.f_closure = ()
+        self.f_state = FrameState.CLEARED
+
     @property
     def code(self):
         return self.f_code
@@ -125,11 +145,11 @@ class Frame:
 
     def next_instr(self) -> tuple[int, int]:
         lasti = self.f_lasti
-        self.f_lasti += 2
-        return self.f_code.co_code[lasti:self.f_lasti]
+        self.f_lasti += 1
+        return self.f_instrs[lasti]
 
     def can_advance(self) -> int:
-        return self.f_lasti < len(self.f_code.co_code)
+        return self.f_lasti < len(self.f_instrs)
 
     def returned(self):
         return self.f_state == FrameState.RETURNED
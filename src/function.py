@@ -1,19 +1,17 @@
-import inspect
 from collections.abc import Coroutine as CoroutineBase
 from functools import partial
-from types import CodeType, FunctionType
+from types import CodeType
 from typing import Any
 
-
-def make_cell(value):
-    # Thanks to Alex Gaynor for help with this bit of twistiness.
-    # Construct an actual cell object by creating a closure right here,
-    # and grabbing the cell object out of the function we create.
-    fn = (lambda x: lambda: x)(value)
-    return fn.__closure__[0]
+# 绑定参数时标记尚未赋值的形参，也是 LOAD_METHOD 没有找到未绑定方法时压入的占位值
+NULL = object()
+# 未赋值或已删除的局部变量和单元变量，VM 代码无法得到这个对象
+UNBOUND = object()
 
 
 class Cell:
+    __slots__ = ('value',)
+
     def __init__(self, value: Any):
         self.value = value
 
@@ -26,21 +24,147 @@ class CodeFlag:
     NESTED = 0x0010
     GENERATOR = 0x0020
     COROUTINE = 0x0080
+    ITERABLE_COROUTINE = 0x0100
+    ASYNC_GENERATOR = 0x0200
+
+
+def join_names(names: list[str]) -> str:
+    names = [repr(name) for name in names]
+    if len(names) == 1:
+        return names[0]
+    if len(names) == 2:
+        return '{} and {}'.format(*names)
+    return '{}, and {}'.format(', '.join(names[:-1]), names[-1])
+
+
+class BindingPlan:
+    # 每个代码对象计算一次的参数绑定方案，
+    # 快速局部变量依次为：位置参数、仅关键字参数、*args、**kwargs
+
+    def __init__(self, code: CodeType) -> None:
+        self.argcount = code.co_argcount
+        self.posonlyargcount = code.co_posonlyargcount
+        self.kwonlyargcount = code.co_kwonlyargcount
+        self.varargs = bool(code.co_flags & CodeFlag.VARARGS)
+        self.varkeywords = bool(code.co_flags & CodeFlag.VARKEYWORDS)
+        self.nparams = self.argcount + self.kwonlyargcount + self.varargs + self.varkeywords
+        self.names = code.co_varnames[:self.nparams]
+        self.kwonly_names = code.co_varnames[self.argcount:self.argcount + self.kwonlyargcount]
+        self.posonly_names = frozenset(code.co_varnames[:self.posonlyargcount])
+        # 可以通过关键字传入的形参 -> 下标
+        self.keyword_index = {
+            name: i for i, name in enumerate(code.co_varnames[:self.argcount + self.kwonlyargcount])
+            if i >= self.posonlyargcount}
+        # 只有位置参数，调用时可以不经过通用路径
+        self.simple = not (self.kwonlyargcount or self.varargs or self.varkeywords)
+
+    def bind(self, func: 'Function', args: tuple[Any], kwargs: dict[str, Any]) -> tuple[Any]:
+        if not kwargs and self.simple:
+            nargs = len(args)
+            if nargs == self.argcount:
+                return args
+            first_default = self.argcount - len(func.func_defaults)
+            if first_default <= nargs < self.argcount:
+                return (*args, *func.func_defaults[nargs - first_default:])
+        return self.bind_general(func, args, kwargs)
+
+    def bind_general(self, func: 'Function', args: tuple[Any], kwargs: dict[str, Any]) -> list[Any]:
+        # 检查的顺序与 CPython 相同：关键字参数的错误先于位置参数过多，错误信息使用函数的限定名
+        name = func.func_name
+        argcount = self.argcount
+        nargs = len(args)
+        fast_locals = [NULL] * self.nparams
+        if nargs > argcount:
+            fast_locals[:argcount] = args[:argcount]
+            varargs = tuple(args[argcount:])
+        else:
+            fast_locals[:nargs] = args
+            varargs = ()
+
+        varkeywords = {}
+        for key, value in kwargs.items():
+            i = self.keyword_index.get(key)
+            if i is None:
+                if self.varkeywords:
+                    varkeywords[key] = value
+                    continue
+                posonly = [key for key in kwargs if key in self.posonly_names]
+                if posonly:
+                    raise TypeError('{}() got some positional-only arguments passed as '
+                                    'keyword arguments: {}'.format(name, repr(', '.join(posonly))))
+                raise TypeError('{}() got an unexpected keyword argument {}'.format(name, repr(key)))
+            if fast_locals[i] is not NULL:
+                raise TypeError('{}() got multiple values for argument {}'.format(name, repr(key)))
+            fast_locals[i] = value
+
+        if nargs > argcount and not self.varargs:
+            self.raise_too_many(func, nargs, kwargs)
+
+        defaults = func.func_defaults
+        first_default = argcount - len(defaults)
+        missing = []
+        for i in range(nargs, argcount):
+            if fast_locals[i] is NULL:
+                if i >= first_default:
+                    fast_locals[i] = defaults[i - first_default]
+                else:
+                    missing.append(self.names[i])
+        if missing:
+            raise TypeError('{}() missing {} required positional argument{}: {}'.format(
+                name, len(missing), 's' if len(missing) > 1 else '', join_names(missing)))
+
+        for i, key in enumerate(self.kwonly_names, argcount):
+            if fast_locals[i] is NULL:
+                if func.func_kwdefaults and key in func.func_kwdefaults:
+                    fast_locals[i] = func.func_kwdefaults[key]
+                else:
+                    missing.append(key)
+        if missing:
+            raise TypeError('{}() missing {} required keyword-only argument{}: {}'.format(
+                name, len(missing), 's' if len(missing) > 1 else '', join_names(missing)))
+
+        i = argcount + self.kwonlyargcount
+        if self.varargs:
+            fast_locals[i] = varargs
+            i += 1
+        if self.varkeywords:
+            fast_locals[i] = varkeywords
+        return fast_locals
+
+    def raise_too_many(self, func: 'Function', nargs: int, kwargs: dict[str, Any]):
+        ndefaults = len(func.func_defaults)
+        if ndefaults:
+            expected = 'from {} to {}'.format(self.argcount - ndefaults, self.argcount)
+        else:
+            expected = str(self.argcount)
+        given = str(nargs)
+        nkwonly = sum(1 for name in self.kwonly_names if name in kwargs)
+        if nkwonly:
+            given = '{} positional argument{} (and {} keyword-only argument{})'.format(
+                nargs, 's' if nargs != 1 else '', nkwonly, 's' if nkwonly != 1 else '')
+        raise TypeError('{}() takes {} positional argument{} but {} {} given'.format(
+            func.func_name, expected, 's' if self.argcount != 1 else '',
+            given, 'was' if nargs == 1 and not nkwonly else 'were'))
 
 
 class Function:
+    # 保留 __dict__ 以支持 functools.wraps 等设置任意属性的用法
+    __slots__ = ('func_name', 'func_code', 'func_code_info', 'func_binding', 'func_globals',
+                 'func_defaults', 'func_kwdefaults', 'func_closure', '_interpreter', '__dict__')
 
-    def __init__(self, name: str, code: CodeType, globals: dict[str, Any],
-                 defaults: tuple[Any] = (), closure: tuple[Cell] = (), interpreter=None) -> None:
+    def __init__(self, name: str, code: CodeType, code_info, globals: dict[str, Any],
+                 defaults: tuple[Any] = (), kwdefaults: dict[str, Any] = None,
+                 closure: tuple[Cell] = (), interpreter=None) -> None:
         self.func_name = name
         self.func_code = code
+        self.func_code_info = code_info
+        self.func_binding = code_info.binding
 
         self.func_globals = globals
         self.func_defaults = defaults
+        self.func_kwdefaults = kwdefaults
         self.func_closure = closure
 
-        helper_closure = tuple(make_cell(0) for c in closure)
-        self._helper = FunctionType(code, globals, name, defaults, helper_closure)
         self._interpreter = interpreter
 
     @property
@@ -59,6 +183,10 @@ class Function:
     def defaults(self):
         return self.func_defaults
 
+    @property
+    def kwdefaults(self):
+        return self.func_kwdefaults
+
     @property
     def argcount(self):
         return self.func_code.co_argcount
@@ -76,16 +204,7 @@ class Function:
         return self
 
     def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        callargs = inspect.getcallargs(self._helper, *args, **kwargs)
-        args = [... for _ in range(len(callargs))]
-        i = 0
-        for name in self.code.co_varnames:
-            if name in callargs:
-                args[i] = callargs.pop(name)
-                i += 1
-        for value in callargs.values():
-            args[i] = value
-            i += 1
+        args = self.func_binding.bind(self, args, kwargs)
         frame = self._interpreter.make_frame(self, args)
         co_flags = self.func_code.co_flags
         if co_flags & CodeFlag.GENERATOR:
@@ -96,34 +215,185 @@ class Function:
 
 
 class Generator:
+    __slots__ = ('frame', 'interpreter', 'started', 'finished', 'delegate', 'delegator', 'awaiting', 'exc_info')
 
     def __init__(self, frame, interpreter) -> None:
         self.frame = frame
         self.interpreter = interpreter
         self.started = False
         self.finished = False
+        # 停在 YIELD_FROM 上时委托的子生成器，以及反向的委托者
+        self.delegate = None
+        self.delegator = None
+        # 停在 YIELD_FROM 上时委托的其他迭代器（原生协程、asyncio.Future 等），throw/close 时转发给它
+        self.awaiting = None
+        # 在 except 处理代码中挂起时正在处理的异常，恢复时换入 Interpreter.exc_info
+        self.exc_info = None
 
     def __iter__(self) -> 'Generator':
         return self
 
     def __next__(self) -> Any:
-        return self.send(None)
+        if self.finished:
+            raise StopIteration
+        self.started = True
+        retval = self.resume(None)
+        if self.finished:
+            raise StopIteration(retval)
+        return retval
 
     def send(self, value: Any) -> Any:
-        if not self.started and value is not None:
-            raise TypeError("Can't send non-None value to a just-started generator")
-        self.frame.push(value)
-        self.started = True
-        retval = self.interpreter.eval_frame(self.frame)
-        if self.frame.returned():
+        if not self.started:
+            if value is not None:
+                raise TypeError("Can't send non-None value to a just-started generator")
+            self.started = True
+        elif self.finished:
+            raise StopIteration
+        retval = self.resume(value)
+        if self.finished:
+            raise StopIteration(retval)
+        return retval
+
+    def throw(self, typ, val=None, tb=None) -> Any:
+        if isinstance(typ, BaseException):
+            exc = typ
+        elif isinstance(val, BaseException):
+            exc = val
+        else:
+            exc = typ() if val is None else typ(val)
+        if tb is not None:
+            exc = exc.with_traceback(tb)
+        if not self.started or self.finished:
+            self.finished = True
+            raise exc
+        gen = self.leaf()
+        awaiting = gen.awaiting
+        if gen.finished:
+            # 子生成器已经在委托链之外执行完毕，异常在委托者的 YIELD_FROM 处抛出
+            gen = self.unlink(gen)
+        elif awaiting is not None:
+            if hasattr(awaiting, 'throw'):
+                try:
+                    retval = awaiting.throw(exc)
+                except StopIteration as ex:
+                    # 被委托的迭代器处理了异常并结束，YIELD_FROM 以它的返回值完成
+                    gen.awaiting = None
+                    frame = gen.frame
+                    frame.f_stack[-1] = ex.value
+                    frame.f_lasti += 1
+                    retval = self.run(gen)
+                    if self.finished:
+                        raise StopIteration(retval)
+                    return retval
+                except BaseException as ex:
+                    exc = ex
+                else:
+                    return retval
+            # 与 CPython 相同，弹出被委托的迭代器，异常在 YIELD_FROM 之后的位置抛出
+            gen.awaiting = None
+            gen.frame.f_stack.pop()
+            gen.frame.f_lasti += 1
+        retval = self.run(gen, exc)
+        if self.finished:
             raise StopIteration(retval)
         return retval
 
+    def close(self):
+        if not self.started or self.finished:
+            self.finished = True
+            return
+        try:
+            self.throw(GeneratorExit)
+        except (GeneratorExit, StopIteration):
+            return
+        raise RuntimeError('generator ignored GeneratorExit')
+
+    def leaf(self) -> 'Generator':
+        gen = self
+        while gen.delegate is not None:
+            gen = gen.delegate
+        return gen
+
+    def resume(self, value: Any) -> Any:
+        # 返回产出的值，执行完毕时 finished 为 True，返回生成器的返回值。
+        # 沿委托链直接恢复最内层的生成器，中间的帧保持挂起
+        gen = self
+        while gen.delegate is not None:
+            gen = gen.delegate
+        if gen.finished:
+            # 子生成器已经在委托链之外执行完毕，委托者的 YIELD_FROM 得到 None
+            gen = self.pop_delegate(gen, None)
+        else:
+            gen.awaiting = None
+            gen.frame.f_stack.append(value)
+        return self.run(gen)
+
+    def run(self, gen: 'Generator', exc: BaseException = None) -> Any:
+        interpreter = self.interpreter
+        # 与 CPython 相同，生成器没有正在处理的异常时看到的是调用者的
+        caller_exc_info = interpreter.exc_info
+        while True:
+            if gen.exc_info is not None:
+                interpreter.exc_info, gen.exc_info = gen.exc_info, None
+            try:
+                retval = interpreter.eval_frame(gen.frame, exc)
+            except BaseException as ex:
+                # gen 的帧没有处理异常，gen 结束，异常传给委托者，在它的 YIELD_FROM 处抛出
+                interpreter.exc_info = caller_exc_info
+                gen.finished = True
+                gen.awaiting = None
+                gen.frame.clear()
+                if isinstance(ex, StopIteration):
+                    # PEP 479
+                    error = RuntimeError('generator raised StopIteration')
+                    error.__cause__ = ex
+                    ex = error
+                if gen is self:
+                    raise ex
+                exc = ex
+                gen = self.unlink(gen)
+                continue
+            exc = None
+            if interpreter.exc_info is not caller_exc_info:
+                # 在 except 处理代码中挂起，保存生成器的异常，换回调用者的
+                gen.exc_info = interpreter.exc_info
+                interpreter.exc_info = caller_exc_info
+            if not gen.frame.returned():
+                # YIELD_FROM 处理函数在开始委托时设置 interpreter.delegate
+                delegate = interpreter.delegate
+                if delegate is not None:
+                    interpreter.delegate = None
+                    if isinstance(delegate, Generator):
+                        gen.delegate = delegate
+                        delegate.delegator = gen
+                    else:
+                        gen.awaiting = delegate
+                return retval
+            gen.finished = True
+            if gen is self:
+                return retval
+            gen = self.pop_delegate(gen, retval)
+
+    @staticmethod
+    def unlink(gen: 'Generator') -> 'Generator':
+        # 把 gen 从委托链上摘下，弹出委托者栈顶的 gen 并越过 YIELD_FROM，返回委托者
+        child, gen = gen, gen.delegator
+        child.delegator = gen.delegate = None
+        frame = gen.frame
+        frame.f_stack.pop()
+        frame.f_lasti += 1
+        return gen
+
+    @staticmethod
+    def pop_delegate(gen: 'Generator', retval: Any) -> 'Generator':
+        # 子生成器结束，委托者的 YIELD_FROM 以返回值完成，返回委托者
+        gen = Generator.unlink(gen)
+        gen.frame.f_stack.append(retval)
+        return gen
+
 
 class Coroutine(Generator, CoroutineBase):
+    __slots__ = ()
 
     def __await__(self):
         return self
-
-    def throw(self):
-        pass
@@ -0,0 +1,148 @@
+import time
+from typing import Any
+
+from src.vmtraceback import line_of
+
+
+class ResourceLimitExceeded(Exception):
+
+    def __init__(self, limit: str, value: Any, maximum: Any, frames: list[tuple[str, str, int]]) -> None:
+        super().__init__(limit, value, maximum, frames)
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+        # 停止时的 VM 帧链，从最外层到最内层的 (函数名, 文件名, 行号)
+        self.frames = frames
+
+    def __str__(self):
+        lines = ['{} limit exceeded: {} > {}'.format(self.limit, self.value, self.maximum)]
+        lines += ['  {} ({}:{})'.format(*frame) for frame in self.frames]
+        return '\n'.join(lines)
+
+
+class Limits:
+    __slots__ = ('max_instructions', 'timeout', 'max_depth', 'max_stack', 'check_interval')
+
+    def __init__(self, max_instructions: int = None, timeout: float = None, max_depth: int = None,
+                 max_stack: int = None, check_interval: int = 1000) -> None:
+        self.max_instructions = max_instructions
+        # 墙钟时间，单位秒
+        self.timeout = timeout
+        # 帧链的深度和所有帧的值栈元素总数
+        self.max_depth = max_depth
+        self.max_stack = max_stack
+        # 每执行这么多条指令检查一次时间和值栈，超出的部分不超过一个检查间隔；深度在进入帧时检查
+        self.check_interval = check_interval
+
+
+class Governor:
+    # 通过 Interpreter.hook 检查资源限制。hook 对指令计数，指令数上限是精确的：
+    # 第 max_instructions + 1 条指令执行之前抛出异常；时间和值栈每 check_interval 条指令检查一次，
+    # 不需要每条指令都读时钟。帧深度在进入帧时由 frame_hook 检查
+
+    def __init__(self, interpreter, limits: Limits) -> None:
+        self.interpreter = interpreter
+        self.limits = limits
+        self.deadline = None
+        # 已经执行的指令数
+        self.instructions = 0
+        self.next_check = limits.check_interval
+        # 下一次需要 event 处理的指令数：定期检查或超出指令数上限
+        self.next_event = None
+        self.schedule()
+        # 正在执行的帧的深度，只在限制深度时由 frame_event 维护
+        self.depth = 0
+
+    def instruction(self, frame):
+        self.instructions += 1
+        if self.instructions >= self.next_event:
+            self.event()
+
+    def event(self):
+        limits = self.limits
+        if limits.max_instructions is not None and self.instructions > limits.max_instructions:
+            # 这条指令不会执行
+            self.instructions -= 1
+            self.trip('instructions', limits.max_instructions + 1, limits.max_instructions)
+        if self.instructions >= self.next_check:
+            self.next_check += limits.check_interval
+            self.check()
+        self.schedule()
+
+    def schedule(self):
+        self.next_event = self.next_check
+        if self.limits.max_instructions is not None:
+            self.next_event = min(self.next_event, self.limits.max_instructions + 1)
+
+    def frame_event(self, frame, event: str):
+        if event == 'return':
+            self.depth -= 1
+        elif self.depth >= self.limits.max_depth:
+            # 超出限制的帧不计入深度，它不会再产生 'return'
+            self.trip('depth', self.depth + 1, self.limits.max_depth)
+        else:
+            self.depth += 1
+
+    def run(self, frame):
+        interpreter = self.interpreter
+        limits = self.limits
+        if limits.timeout is not None:
+            self.deadline = time.monotonic() + limits.timeout
+        hook = previous_hook = interpreter.hook
+        frame_hook = previous_frame_hook = interpreter.frame_hook
+        if previous_hook is None:
+            hook = self.instruction
+        else:
+            def hook(frame):
+                previous_hook(frame)
+                self.instruction(frame)
+        if limits.max_depth is not None:
+            back = interpreter.frame
+            while back is not None:
+                self.depth += 1
+                back = back.f_back
+            if previous_frame_hook is None:
+                frame_hook = self.frame_event
+            else:
+                def frame_hook(frame, event):
+                    previous_frame_hook(frame, event)
+                    self.frame_event(frame, event)
+        interpreter.hook = hook
+        interpreter.frame_hook = frame_hook
+        try:
+            interpreter.eval_frame(frame)
+        finally:
+            interpreter.hook = previous_hook
+            interpreter.frame_hook = previous_frame_hook
+
+    def check(self):
+        limits = self.limits
+        if self.deadline is not None:
+            now = time.monotonic()
+            if now > self.deadline:
+                self.trip('timeout', now - self.deadline + limits.timeout, limits.timeout)
+        if limits.max_stack is not None:
+            stack = 0
+            frame = self.interpreter.frame
+            while frame is not None:
+                stack += len(frame.f_stack)
+                frame = frame.f_back
+            if stack > limits.max_stack:
+                self.trip('stack', stack, limits.max_stack)
+
+    def trip(self, limit: str, value: Any, maximum: Any):
+        raise ResourceLimitExceeded(limit, value, maximum, self.frames())
+
+    def frames(self) -> list[tuple[str, str, int]]:
+        frames = []
+        frame = self.interpreter.frame
+        # hook 在指令执行前调用，最内层帧的 f_lasti 就是将要执行的指令，外层帧的 f_lasti - 1 是正在进行的调用
+        index = frame.f_lasti if frame is not None else 0
+        while frame is not None:
+            code = frame.f_code
+            frames.append((code.co_name, code.co_filename, line_of(code, min(index, len(frame.f_instrs) - 1))))
+            frame = frame.f_back
+            if frame is not None:
+                index = max(frame.f_lasti - 1, 0)
+        frames.reverse()
+        return frames
@@ -0,0 +1,88 @@
+from itertools import count
+from typing import Any
+
+next_version = count(1).__next__
+
+
+class Namespace(dict):
+    # 带版本号的字典，版本号全局唯一，相等即说明是同一个字典且未被修改。
+    # keys_version 只在增删键时改变，version 在任何修改时都会改变
+    __slots__ = ('keys_version', 'version')
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.keys_version = self.version = next_version()
+
+    def _keys_changed(self):
+        self.keys_version = self.version = next_version()
+
+    def __setitem__(self, key, value):
+        if key in self:
+            dict.__setitem__(self, key, value)
+            self.version = next_version()
+        else:
+            dict.__setitem__(self, key, value)
+            self._keys_changed()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._keys_changed()
+
+    def __ior__(self, other):
+        dict.update(self, other)
+        self._keys_changed()
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        dict.update(self, *args, **kwargs)
+        self._keys_changed()
+
+    def pop(self, *args: Any) -> Any:
+        value = dict.pop(self, *args)
+        self._keys_changed()
+        return value
+
+    def popitem(self) -> tuple[Any, Any]:
+        item = dict.popitem(self)
+        self._keys_changed()
+        return item
+
+    def clear(self) -> None:
+        dict.clear(self)
+        self._keys_changed()
+
+
+class GlobalCache:
+    # LOAD_GLOBAL 的内联缓存。builtins_version 为 0 表示名字在 globals 中找到，
+    # 否则在 builtins 中找到且 value 为缓存的值
+    __slots__ = ('name', 'globals_keys_version', 'builtins_version', 'value')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.globals_keys_version = 0
+        self.builtins_version = 0
+        self.value = None
+
+    def __repr__(self):
+        return '<GlobalCache {}>'.format(repr(self.name))
+
+
+class NameCache:
+    # LOAD_NAME 的内联缓存，依次记录 locals、globals、builtins 的版本号，
+    # 找到名字的命名空间之后的版本号为 0
+    __slots__ = ('name', 'locals_keys_version', 'globals_keys_version', 'builtins_version', 'value')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.locals_keys_version = 0
+        self.globals_keys_version = 0
+        self.builtins_version = 0
+        self.value = None
+
+    def __repr__(self):
+        return '<NameCache {}>'.format(repr(self.name))
@@ -1,4 +1,11 @@
+import dis
 import operator
+from functools import partial
+from types import CoroutineType, _GeneratorWrapper
+from typing import Any
+
+from src import attrcache
+from src.function import NULL, UNBOUND, Function, Generator
 
 
 class OpCode:
@@ -129,6 +136,45 @@ class OpCode:
     SET_UPDATE = 163
     DICT_MERGE = 164
     DICT_UPDATE = 165
+    # 超级指令，加载时由相邻的两条指令合并而成
+    LOAD_FAST__LOAD_FAST = 200
+    LOAD_FAST__LOAD_CONST = 201
+    COMPARE_OP__POP_JUMP_IF_FALSE = 202
+    FOR_ITER__STORE_FAST = 203
+    LOAD_CONST__BINARY_OP = 204
+    LOAD_FAST__BINARY_OP = 205
+    # 自适应指令，参数为 AdaptiveCache，预热后按操作数类型改写为下面的特化指令
+    ADAPTIVE = 206
+    # 优化器折叠的常量，参数为常量元组和模板字典本身，见 peephole.fold_constants
+    LOAD_CONST_VALUE = 207
+    COPY_CONST_MAP = 208
+    # 可能未赋值的局部变量的 LOAD_FAST，见 codeinfo.check_unbound
+    LOAD_FAST_CHECK = 209
+    BINARY_ADD_INT = 210
+    BINARY_ADD_FLOAT = 211
+    BINARY_ADD_STR = 212
+    BINARY_SUBTRACT_INT = 213
+    BINARY_SUBTRACT_FLOAT = 214
+    BINARY_MULTIPLY_INT = 215
+    BINARY_MULTIPLY_FLOAT = 216
+    BINARY_SUBSCR_LIST_INT = 217
+    BINARY_SUBSCR_TUPLE_INT = 218
+    BINARY_SUBSCR_DICT = 219
+    COMPARE_OP_INT = 220
+    COMPARE_OP_FLOAT = 221
+    COMPARE_OP_STR = 222
+    COMPARE_OP_INT__POP_JUMP_IF_FALSE = 223
+    COMPARE_OP_FLOAT__POP_JUMP_IF_FALSE = 224
+    COMPARE_OP_STR__POP_JUMP_IF_FALSE = 225
+    FOR_ITER_RANGE = 226
+    FOR_ITER_LIST = 227
+    FOR_ITER_RANGE__STORE_FAST = 228
+    FOR_ITER_LIST__STORE_FAST = 229
+    FOR_ITER_GENERATOR = 230
+    FOR_ITER_GENERATOR__STORE_FAST = 231
+
+
+OPNAMES = {v: k for k, v in vars(OpCode).items() if k.isupper()}
 
 
 BINARY_MAP = {
@@ -172,6 +218,9 @@ INPLACE_MAP = {
 
 BINARY_OPERATOR = BINARY_MAP | INPLACE_MAP
 
+# 可以与前一条 LOAD_CONST/LOAD_FAST 合并的二元运算
+FUSABLE_BINARY = BINARY_OPERATOR | {OpCode.BINARY_SUBSCR: operator.getitem}
+
 
 class CompareOp:
     LESS = 0
@@ -200,3 +249,846 @@ COMPARE_MAP = {
     # CompareOp.IS_NOT: operator.is_not,
     # CompareOp.EXC_MATCH: operator.less,
 }
+
+
+HAS_JREL = frozenset([
+    OpCode.FOR_ITER,
+    OpCode.JUMP_FORWARD,
+    OpCode.SETUP_FINALLY,
+    OpCode.SETUP_WITH,
+    OpCode.SETUP_ASYNC_WITH,
+])
+
+HAS_JABS = frozenset([
+    OpCode.JUMP_IF_FALSE_OR_POP,
+    OpCode.JUMP_IF_TRUE_OR_POP,
+    OpCode.JUMP_ABSOLUTE,
+    OpCode.POP_JUMP_IF_FALSE,
+    OpCode.POP_JUMP_IF_TRUE,
+    OpCode.JUMP_IF_NOT_EXC_MATCH,
+])
+
+JUMPS = HAS_JREL | HAS_JABS
+UNCONDITIONAL_JUMPS = frozenset([OpCode.JUMP_FORWARD, OpCode.JUMP_ABSOLUTE])
+TERMINATORS = frozenset([OpCode.RETURN_VALUE, OpCode.RERAISE, OpCode.RAISE_VARARGS])
+BLOCK_SETUP = frozenset([OpCode.SETUP_FINALLY, OpCode.SETUP_WITH, OpCode.SETUP_ASYNC_WITH])
+BLOCK_POP = frozenset([OpCode.POP_BLOCK, OpCode.POP_EXCEPT, OpCode.END_ASYNC_FOR])
+CONST_LOADS = frozenset([OpCode.LOAD_CONST, OpCode.LOAD_CONST_VALUE])
+
+
+def stack_effect(opcode: int, oparg: Any, jump: bool = None) -> int:
+    # dis.stack_effect 加上优化器生成的指令
+    if opcode in CONST_LOADS or opcode in (OpCode.COPY_CONST_MAP, OpCode.LOAD_FAST_CHECK):
+        return 1
+    return dis.stack_effect(opcode, oparg if opcode >= dis.HAVE_ARGUMENT else None, jump=jump)
+
+
+SUPERINSTRUCTIONS = {
+    (OpCode.LOAD_FAST, OpCode.LOAD_FAST): OpCode.LOAD_FAST__LOAD_FAST,
+    (OpCode.LOAD_FAST, OpCode.LOAD_CONST): OpCode.LOAD_FAST__LOAD_CONST,
+    (OpCode.COMPARE_OP, OpCode.POP_JUMP_IF_FALSE): OpCode.COMPARE_OP__POP_JUMP_IF_FALSE,
+    (OpCode.FOR_ITER, OpCode.STORE_FAST): OpCode.FOR_ITER__STORE_FAST,
+}
+for opcode in FUSABLE_BINARY:
+    SUPERINSTRUCTIONS[(OpCode.LOAD_CONST, opcode)] = OpCode.LOAD_CONST__BINARY_OP
+    SUPERINSTRUCTIONS[(OpCode.LOAD_FAST, opcode)] = OpCode.LOAD_FAST__BINARY_OP
+# 参数为 (下标, 运算函数) 的超级指令
+BINARY_SUPERINSTRUCTIONS = frozenset([OpCode.LOAD_CONST__BINARY_OP, OpCode.LOAD_FAST__BINARY_OP])
+
+
+class Why:
+    # 处理函数的返回值，非零表示退出求值循环
+    NOT = 0
+    RETURN = 1
+    YIELD = 2
+
+
+def unrecognized(opcode):
+    def handler(vm, frame, oparg):
+        raise RuntimeError('Unrecognized opcode: %s' % opcode)
+    return handler
+
+
+HANDLERS = [unrecognized(opcode) for opcode in range(256)]
+
+
+def handler(*opcodes):
+    def decorator(func):
+        for opcode in opcodes:
+            HANDLERS[opcode] = func
+        return func
+    return decorator
+
+
+def binary_handler(operator):
+    def handler(vm, frame, oparg):
+        a, b = frame.f_stack.pop(), frame.f_stack.pop()
+        frame.f_stack.append(operator(b, a))
+    return handler
+
+
+def unary_handler(operator):
+    def handler(vm, frame, oparg):
+        frame.f_stack.append(operator(frame.f_stack.pop()))
+    return handler
+
+
+for opcode, operator_ in BINARY_OPERATOR.items():
+    HANDLERS[opcode] = binary_handler(operator_)
+
+for opcode, operator_ in UNARY_MAP.items():
+    HANDLERS[opcode] = unary_handler(operator_)
+
+
+# 块栈在运行前由 codeinfo.block_table 计算，展开时按指令下标查表，建立和弹出块的指令什么也不做
+@handler(OpCode.NOP, OpCode.SETUP_FINALLY, OpCode.SETUP_ASYNC_WITH, OpCode.POP_BLOCK)
+def nop(vm, frame, oparg):
+    pass
+
+
+@handler(OpCode.POP_TOP)
+def pop_top(vm, frame, oparg):
+    frame.f_stack.pop()
+
+
+@handler(OpCode.DUP_TOP)
+def dup_top(vm, frame, oparg):
+    frame.f_stack.append(frame.f_stack[-1])
+
+
+@handler(OpCode.DUP_TOP_TWO)
+def dup_top_two(vm, frame, oparg):
+    # 下标的增量赋值 a[i] += x 复制容器和下标
+    frame.f_stack.extend(frame.f_stack[-2:])
+
+
+@handler(OpCode.ROT_TWO)
+def rot_two(vm, frame, oparg):
+    # 交换两个最顶层的堆栈项
+    a, b = frame.f_stack.pop(), frame.f_stack.pop()
+    frame.f_stack.append(a)
+    frame.f_stack.append(b)
+
+
+@handler(OpCode.ROT_THREE)
+def rot_three(vm, frame, oparg):
+    a, b, c = frame.f_stack.pop(), frame.f_stack.pop(), frame.f_stack.pop()
+    # 将第二个和第三个堆栈项向上提升一个位置，顶项移动到位置三
+    frame.f_stack.append(a)
+    frame.f_stack.append(c)
+    frame.f_stack.append(b)
+
+
+@handler(OpCode.ROT_FOUR)
+def rot_four(vm, frame, oparg):
+    # 将第二、三、四个堆栈项向上提升一个位置，顶项移动到位置四。
+    # except 块中的 return 用它把返回值移到三个异常值之下
+    stack = frame.f_stack
+    stack.insert(-3, stack.pop())
+
+
+@handler(OpCode.GET_LEN)
+def get_len(vm, frame, oparg):
+    frame.f_stack.append(len(frame.f_stack[-1]))
+
+
+@handler(OpCode.BINARY_SUBSCR)
+def binary_subscr(vm, frame, oparg):
+    index = frame.f_stack.pop()
+    obj = frame.f_stack.pop()
+    frame.f_stack.append(obj[index])
+
+
+@handler(OpCode.STORE_SUBSCR)
+def store_subscr(vm, frame, oparg):
+    index = frame.f_stack.pop()
+    obj = frame.f_stack.pop()
+    obj[index] = frame.f_stack.pop()
+
+
+@handler(OpCode.DELETE_SUBSCR)
+def delete_subscr(vm, frame, oparg):
+    index = frame.f_stack.pop()
+    obj = frame.f_stack.pop()
+    del obj[index]
+
+
+@handler(OpCode.GET_ITER)
+def get_iter(vm, frame, oparg):
+    frame.f_stack.append(iter(frame.f_stack.pop()))
+
+
+@handler(OpCode.RETURN_VALUE)
+def return_value(vm, frame, oparg):
+    vm.return_value = frame.f_stack.pop()
+    return Why.RETURN
+
+
+@handler(OpCode.STORE_NAME)
+def store_name(vm, frame, oparg):
+    name = frame.f_code.co_names[oparg]
+    frame.f_locals[name] = frame.f_stack.pop()
+
+
+@handler(OpCode.UNPACK_SEQUENCE)
+def unpack_sequence(vm, frame, oparg):
+    values = tuple(frame.f_stack.pop())
+    assert len(values) == oparg
+    frame.f_stack.extend(values[::-1])
+
+
+@handler(OpCode.UNPACK_EX)
+def unpack_ex(vm, frame, oparg):
+    leftcount = oparg & 0xFF
+    rightcount = oparg >> 8
+    assert rightcount == 2
+    assert leftcount == 3
+    sequence = frame.f_stack.pop()
+    for i in range(len(sequence) - 1, len(sequence) - rightcount - 1, -1):
+        frame.f_stack.append(sequence[i])
+    frame.f_stack.append([sequence[i] for i in range(leftcount, len(sequence) - rightcount)])
+    for i in range(leftcount - 1, -1, -1):
+        frame.f_stack.append(sequence[i])
+
+
+@handler(OpCode.DELETE_NAME)
+def delete_name(vm, frame, oparg):
+    name = frame.f_code.co_names[oparg]
+    del frame.f_locals[name]
+
+
+@handler(OpCode.FOR_ITER)
+def for_iter(vm, frame, oparg):
+    itor = frame.f_stack[-1]
+    try:
+        frame.f_stack.append(next(itor))
+    except StopIteration:
+        frame.f_stack.pop()
+        frame.f_lasti = oparg
+
+
+@handler(OpCode.STORE_GLOBAL)
+def store_global(vm, frame, oparg):
+    name = frame.f_code.co_names[oparg]
+    frame.f_globals[name] = frame.f_stack.pop()
+
+
+@handler(OpCode.DELETE_GLOBAL)
+def delete_global(vm, frame, oparg):
+    name = frame.f_code.co_names[oparg]
+    del frame.f_globals[name]
+
+
+@handler(OpCode.LOAD_CONST)
+def load_const(vm, frame, oparg):
+    frame.f_stack.append(frame.f_code.co_consts[oparg])
+
+
+@handler(OpCode.LOAD_NAME)
+def load_name(vm, frame, cache):
+    locals = frame.f_locals
+    if cache.locals_keys_version == locals.keys_version:
+        if not cache.globals_keys_version:
+            frame.f_stack.append(locals[cache.name])
+            return
+        globals = frame.f_globals
+        if cache.globals_keys_version == globals.keys_version:
+            if not cache.builtins_version:
+                frame.f_stack.append(globals[cache.name])
+                return
+            if cache.builtins_version == frame.f_builtins.version:
+                frame.f_stack.append(cache.value)
+                return
+    name = cache.name
+    globals, builtins = frame.f_globals, frame.f_builtins
+    cache.locals_keys_version = locals.keys_version
+    cache.globals_keys_version = cache.builtins_version = 0
+    cache.value = None
+    if name in locals:
+        frame.f_stack.append(locals[name])
+    elif name in globals:
+        cache.globals_keys_version = globals.keys_version
+        frame.f_stack.append(globals[name])
+    elif name in builtins:
+        cache.globals_keys_version = globals.keys_version
+        cache.builtins_version = builtins.version
+        cache.value = builtins[name]
+        frame.f_stack.append(cache.value)
+    else:
+        cache.locals_keys_version = 0
+        raise RuntimeError(f'{name} not find')
+
+
+@handler(OpCode.LOAD_CLOSURE)
+def load_closure(vm, frame, oparg):
+    frame.f_stack.append(frame.f_closure[oparg])
+
+
+def unbound_deref(frame, oparg):
+    # 与 CPython 相同，单元变量在前，自由变量在后
+    code = frame.f_code
+    ncells = len(code.co_cellvars)
+    if oparg < ncells:
+        return UnboundLocalError(
+            "local variable '{}' referenced before assignment".format(code.co_cellvars[oparg]))
+    return NameError("free variable '{}' referenced before assignment in enclosing scope".format(
+        code.co_freevars[oparg - ncells]))
+
+
+@handler(OpCode.LOAD_DEREF)
+def load_deref(vm, frame, oparg):
+    value = frame.f_closure[oparg].value
+    if value is UNBOUND:
+        raise unbound_deref(frame, oparg)
+    frame.f_stack.append(value)
+
+
+@handler(OpCode.STORE_DEREF)
+def store_deref(vm, frame, oparg):
+    # 单元在创建帧时建好，由外层帧和所有闭包共享，赋值只修改其中的值
+    frame.f_closure[oparg].value = frame.f_stack.pop()
+
+
+@handler(OpCode.DELETE_DEREF)
+def delete_deref(vm, frame, oparg):
+    cell = frame.f_closure[oparg]
+    if cell.value is UNBOUND:
+        raise unbound_deref(frame, oparg)
+    cell.value = UNBOUND
+
+
+@handler(OpCode.BUILD_TUPLE)
+def build_tuple(vm, frame, oparg):
+    stack = frame.f_stack
+    start = len(stack) - oparg
+    tp = tuple(stack[start:])
+    del stack[start:]
+    stack.append(tp)
+
+
+@handler(OpCode.BUILD_LIST)
+def build_list(vm, frame, oparg):
+    stack = frame.f_stack
+    start = len(stack) - oparg
+    lst = stack[start:]
+    del stack[start:]
+    stack.append(lst)
+
+
+@handler(OpCode.LIST_APPEND)
+def list_append(vm, frame, oparg):
+    value = frame.f_stack.pop()
+    lst = frame.f_stack[-oparg]
+    assert isinstance(lst, list)
+    lst.append(value)
+
+
+@handler(OpCode.LIST_EXTEND)
+def list_extend(vm, frame, oparg):
+    iterable = frame.f_stack.pop()
+    lst = frame.f_stack[-oparg]
+    assert isinstance(lst, list)
+    lst.extend(iterable)
+
+
+@handler(OpCode.BUILD_MAP)
+def build_map(vm, frame, oparg):
+    stack = frame.f_stack
+    start = len(stack) - 2 * oparg
+    items = stack[start:]
+    del stack[start:]
+    stack.append(dict(zip(items[::2], items[1::2])))
+
+
+@handler(OpCode.BUILD_CONST_KEY_MAP)
+def build_const_key_map(vm, frame, oparg):
+    stack = frame.f_stack
+    keys = stack.pop()
+    start = len(stack) - oparg
+    mp = dict(zip(keys, stack[start:]))
+    del stack[start:]
+    stack.append(mp)
+
+
+@handler(OpCode.DICT_MERGE)
+def dict_merge(vm, frame, oparg):
+    d1, d2 = frame.f_stack.pop(), frame.f_stack.pop()
+    for k in d1.keys():
+        assert k not in d2
+    frame.f_stack.append({**d2, **d1})
+
+
+@handler(OpCode.DICT_UPDATE)
+def dict_update(vm, frame, oparg):
+    d1, d2 = frame.f_stack.pop(), frame.f_stack.pop()
+    frame.f_stack.append({**d2, **d1})
+
+
+@handler(OpCode.LOAD_ATTR)
+def load_attr(vm, frame, cache):
+    obj = frame.f_stack.pop()
+    method = cache.entries.get(type(obj))
+    if method is None:
+        method = cache.fill(type(obj))
+    if method and cache.name not in obj.__dict__:
+        frame.f_stack.append(partial(method, obj))
+    else:
+        frame.f_stack.append(getattr(obj, cache.name))
+
+
+@handler(OpCode.LOAD_METHOD)
+def load_method(vm, frame, cache):
+    # 与 CPython 相同，方法是类上的虚拟机 Function 时压入未绑定的函数和接收者，不创建绑定方法；
+    # 否则（内置类型、宿主对象、实例属性等）压入 NULL 和 getattr 的结果
+    stack = frame.f_stack
+    obj = stack[-1]
+    method = cache.entries.get(type(obj))
+    if method is None:
+        method = cache.fill(type(obj))
+    if method and cache.name not in obj.__dict__:
+        stack[-1] = method
+        stack.append(obj)
+    else:
+        attr = getattr(obj, cache.name)
+        stack[-1] = NULL
+        stack.append(attr)
+
+
+@handler(OpCode.STORE_ATTR)
+def store_attr(vm, frame, oparg):
+    obj = frame.f_stack.pop()
+    attr = frame.f_stack.pop()
+    setattr(obj, frame.f_code.co_names[oparg], attr)
+    if isinstance(obj, type):
+        attrcache.invalidate_type(obj)
+
+
+@handler(OpCode.CALL_METHOD)
+def call_method(vm, frame, oparg):
+    # 值栈上依次为 LOAD_METHOD 压入的两个值和 oparg 个参数
+    stack = frame.f_stack
+    start = len(stack) - oparg - 1
+    method = stack[start - 1]
+    if method is NULL:
+        func = stack[start]
+        args = stack[start + 1:]
+        del stack[start - 1:]
+        stack.append(func(*args))
+        return
+    # 接收者和参数原样成为新帧的快速局部变量。只有位置参数且个数正好的普通函数直接创建帧，
+    # 不经过 Function.__call__ 的 *args、**kwargs 打包
+    args = stack[start:]
+    del stack[start - 1:]
+    binding = method.func_binding
+    if binding.simple and len(args) == binding.argcount and method.func_code_info.recyclable:
+        stack.append(vm.eval_frame(vm.make_frame(method, args)))
+    else:
+        stack.append(method(*args))
+
+
+@handler(OpCode.COMPARE_OP)
+def compare_op(vm, frame, oparg):
+    a, b = frame.f_stack.pop(), frame.f_stack.pop()
+    frame.f_stack.append(COMPARE_MAP[oparg](b, a))
+
+
+@handler(OpCode.IS_OP)
+def is_op(vm, frame, oparg):
+    a, b = frame.f_stack.pop(), frame.f_stack.pop()
+    frame.f_stack.append(b is a if oparg == 0 else b is not a)
+
+
+@handler(OpCode.CONTAINS_OP)
+def contains_op(vm, frame, oparg):
+    a, b = frame.f_stack.pop(), frame.f_stack.pop()
+    frame.f_stack.append(b in a if oparg == 0 else b not in a)
+
+
+@handler(OpCode.JUMP_FORWARD, OpCode.JUMP_ABSOLUTE)
+def jump(vm, frame, oparg):
+    # 跳转目标在解码时已转换为指令下标
+    frame.f_lasti = oparg
+
+
+@handler(OpCode.POP_JUMP_IF_FALSE)
+def pop_jump_if_false(vm, frame, oparg):
+    if not frame.f_stack.pop():
+        frame.f_lasti = oparg
+
+
+@handler(OpCode.POP_JUMP_IF_TRUE)
+def pop_jump_if_true(vm, frame, oparg):
+    if frame.f_stack.pop():
+        frame.f_lasti = oparg
+
+
+@handler(OpCode.JUMP_IF_NOT_EXC_MATCH)
+def jump_if_not_exc_match(vm, frame, oparg):
+    right, left = frame.f_stack.pop(), frame.f_stack.pop()
+    if not issubclass(left, right):
+        frame.f_lasti = oparg
+
+
+@handler(OpCode.POP_EXCEPT)
+def pop_except(vm, frame, oparg):
+    # 栈顶是进入处理代码之前的 (类型, 异常, 回溯)
+    stack = frame.f_stack
+    vm.exc_info = stack[-2]
+    del stack[-3:]
+
+
+@handler(OpCode.RERAISE)
+def reraise(vm, frame, oparg):
+    stack = frame.f_stack
+    exc = stack[-2]
+    del stack[-3:]
+    raise exc
+
+
+@handler(OpCode.RAISE_VARARGS)
+def raise_varargs(vm, frame, oparg):
+    if oparg == 0:
+        if vm.exc_info is None:
+            raise RuntimeError('No active exception to reraise')
+        raise vm.exc_info
+    if oparg == 1:
+        raise frame.f_stack.pop()
+    cause = frame.f_stack.pop()
+    raise frame.f_stack.pop() from cause
+
+
+@handler(OpCode.SETUP_WITH)
+def setup_with(vm, frame, oparg):
+    manager = frame.f_stack.pop()
+    frame.f_stack.append(manager.__exit__)
+    frame.f_stack.append(manager.__enter__())
+
+
+@handler(OpCode.WITH_EXCEPT_START)
+def with_except_start(vm, frame, oparg):
+    # 栈上从栈顶起是异常的 (类型, 异常, 回溯)、之前的异常和 __exit__
+    stack = frame.f_stack
+    stack.append(stack[-7](stack[-1], stack[-2], stack[-3]))
+
+
+@handler(OpCode.END_ASYNC_FOR)
+def end_async_for(vm, frame, oparg):
+    stack = frame.f_stack
+    if not issubclass(stack[-1], StopAsyncIteration):
+        raise stack[-2]
+    # 迭代结束，弹出两组异常和异步迭代器
+    vm.exc_info = stack[-5]
+    del stack[-7:]
+
+
+@handler(OpCode.LOAD_GLOBAL)
+def load_global(vm, frame, cache):
+    globals = frame.f_globals
+    if cache.globals_keys_version == globals.keys_version:
+        if not cache.builtins_version:
+            frame.f_stack.append(globals[cache.name])
+            return
+        if cache.builtins_version == frame.f_builtins.version:
+            frame.f_stack.append(cache.value)
+            return
+    name, builtins = cache.name, frame.f_builtins
+    cache.builtins_version = 0
+    cache.value = None
+    if name in globals:
+        cache.globals_keys_version = globals.keys_version
+        frame.f_stack.append(globals[name])
+    elif name in builtins:
+        cache.globals_keys_version = globals.keys_version
+        cache.builtins_version = builtins.version
+        cache.value = builtins[name]
+        frame.f_stack.append(cache.value)
+    else:
+        cache.globals_keys_version = 0
+        raise NameError(f'name {repr(name)} is not defined')
+
+
+@handler(OpCode.BUILD_SET)
+def build_set(vm, frame, oparg):
+    frame.f_stack.append(set())
+
+
+@handler(OpCode.SET_UPDATE)
+def set_update(vm, frame, oparg):
+    iterable = frame.f_stack.pop()
+    s = frame.f_stack[-oparg]
+    assert isinstance(s, set)
+    s.update(iterable)
+
+
+@handler(OpCode.SET_ADD)
+def set_add(vm, frame, oparg):
+    value = frame.f_stack.pop()
+    s = frame.f_stack[-oparg]
+    assert isinstance(s, set)
+    s.add(value)
+
+
+@handler(OpCode.LOAD_FAST)
+def load_fast(vm, frame, oparg):
+    frame.f_stack.append(frame.f_fast_locals[oparg])
+
+
+@handler(OpCode.STORE_FAST)
+def store_fast(vm, frame, oparg):
+    frame.f_fast_locals[oparg] = frame.f_stack.pop()
+
+
+def unbound_local(frame, oparg):
+    return UnboundLocalError(
+        "local variable '{}' referenced before assignment".format(frame.f_code.co_varnames[oparg]))
+
+
+@handler(OpCode.LOAD_FAST_CHECK)
+def load_fast_check(vm, frame, oparg):
+    value = frame.f_fast_locals[oparg]
+    if value is UNBOUND:
+        raise unbound_local(frame, oparg)
+    frame.f_stack.append(value)
+
+
+@handler(OpCode.DELETE_FAST)
+def delete_fast(vm, frame, oparg):
+    fast_locals = frame.f_fast_locals
+    if fast_locals[oparg] is UNBOUND:
+        raise unbound_local(frame, oparg)
+    fast_locals[oparg] = UNBOUND
+
+
+@handler(OpCode.LOAD_BUILD_CLASS)
+def load_build_class(vm, frame, oparg):
+    frame.f_stack.append(vm.build_class)
+
+
+@handler(OpCode.MAKE_FUNCTION)
+def make_function(vm, frame, oparg):
+    # oparg 为 FunctionCache，见 codeinfo.attach_caches
+    stack = frame.f_stack
+    name = stack.pop()
+    code = stack.pop()
+    info = oparg.info if oparg.code is code else oparg.fill(code)
+    flags = oparg.flags
+    if not flags:
+        stack.append(Function(name, code, info, frame.f_globals, (), None, (), vm))
+        return
+    if flags & 0x08:  # 一个包含用于自由变量的单元的元组，生成一个闭包与函数相关联的代码
+        closure = stack.pop()
+    else:
+        closure = ()
+    if flags & 0x04:  # 0x04 形参注解，虚拟机不使用
+        stack.pop()
+    if flags & 0x02:  # 0x02 仅关键字形参默认值的字典
+        kwdefaults = stack.pop()
+    else:
+        kwdefaults = None
+    if flags & 0x01:  # 0x01 一个默认值的元组，用于按位置排序的仅限位置形参以及位置或关键字形参
+        defaults = stack.pop()
+    else:
+        defaults = ()
+    stack.append(Function(name, code, info, frame.f_globals, defaults, kwdefaults, closure, vm))
+
+
+@handler(OpCode.CALL_FUNCTION)
+def call_function(vm, frame, oparg):
+    stack = frame.f_stack
+    start = len(stack) - oparg
+    args = stack[start:]
+    func = stack[start - 1]
+    del stack[start - 1:]
+    stack.append(func(*args))
+
+
+@handler(OpCode.CALL_FUNCTION_KW)
+def call_function_kw(vm, frame, oparg):  # *args **kwargs
+    stack = frame.f_stack
+    argnames = stack.pop()
+    start = len(stack) - oparg
+    kwstart = start + oparg - len(argnames)
+    args = stack[start:kwstart]
+    kwargs = dict(zip(argnames, stack[kwstart:]))
+    func = stack[start - 1]
+    del stack[start - 1:]
+    stack.append(func(*args, **kwargs))
+
+
+@handler(OpCode.CALL_FUNCTION_EX)
+def call_function_ex(vm, frame, oparg):
+    kwargs = frame.f_stack.pop() if oparg == 1 else {}
+    posargs = frame.f_stack.pop()
+    func = frame.f_stack.pop()
+    assert callable(func)
+    frame.f_stack.append(func(*posargs, **kwargs))
+
+
+@handler(OpCode.MAP_ADD)
+def map_add(vm, frame, oparg):
+    value, key = frame.f_stack.pop(), frame.f_stack.pop()
+    mp = frame.f_stack[-oparg]
+    assert isinstance(mp, dict)
+    mp[key] = value
+
+
+@handler(OpCode.GEN_START)
+def gen_start(vm, frame, oparg):
+    frame.f_stack.pop()
+
+
+@handler(OpCode.YIELD_VALUE)
+def yield_value(vm, frame, oparg):
+    vm.return_value = frame.f_stack.pop()
+    return Why.YIELD
+
+
+@handler(OpCode.GET_YIELD_FROM_ITER)
+def get_yield_from_iter(vm, frame, oparg):
+    obj = frame.f_stack.pop()
+    if isinstance(obj, Generator):
+        frame.f_stack.append(obj)
+    else:
+        frame.f_stack.append(iter(obj))
+
+
+@handler(OpCode.YIELD_FROM)
+def yield_from(vm, frame, oparg):
+    value = frame.f_stack.pop()
+    itor = frame.f_stack[-1]
+    try:
+        if value is None and not isinstance(itor, (Generator, CoroutineType)):
+            retval = next(itor)
+        else:
+            retval = itor.send(value)
+    except StopIteration as ex:
+        frame.f_stack.pop()
+        frame.f_stack.append(ex.value)
+    else:
+        frame.f_lasti -= 1
+        vm.return_value = retval
+        # 委托给生成器时之后由 Generator.send 直接恢复 itor，不再经过这条指令；
+        # 其他迭代器记录下来，throw/close 时转发给它
+        vm.delegate = itor
+        return Why.YIELD
+
+
+def awaitable_of(obj):
+    if isinstance(obj, (Generator, CoroutineType)):
+        return obj
+    if type(obj) is _GeneratorWrapper:
+        # types.coroutine 装饰的 VM 生成器函数返回的包装只是转发调用，直接 await 内部的生成器，保留委托的快速路径
+        return obj._GeneratorWrapper__wrapped
+    await_ = getattr(type(obj), '__await__', None)
+    if await_ is None:
+        raise TypeError("object {} can't be used in 'await' expression".format(type(obj).__name__))
+    return await_(obj)
+
+
+@handler(OpCode.GET_AWAITABLE)
+def get_awaitable(vm, frame, oparg):
+    frame.f_stack[-1] = awaitable_of(frame.f_stack[-1])
+
+
+@handler(OpCode.GET_AITER)
+def get_aiter(vm, frame, oparg):
+    frame.f_stack[-1] = frame.f_stack[-1].__aiter__()
+
+
+@handler(OpCode.GET_ANEXT)
+def get_anext(vm, frame, oparg):
+    frame.f_stack.append(awaitable_of(frame.f_stack[-1].__anext__()))
+
+
+@handler(OpCode.BEFORE_ASYNC_WITH)
+def before_async_with(vm, frame, oparg):
+    manager = frame.f_stack.pop()
+    frame.f_stack.append(manager.__aexit__)
+    frame.f_stack.append(manager.__aenter__())
+
+
+@handler(OpCode.IMPORT_NAME)
+def import_name(vm, frame, oparg):
+    name = frame.f_code.co_names[oparg]
+    fromlist, level = frame.f_stack.pop(), frame.f_stack.pop()
+    frame.f_stack.append(__import__(name, frame.f_globals, frame.f_locals, fromlist, level))
+
+
+@handler(OpCode.IMPORT_FROM)
+def import_from(vm, frame, oparg):
+    name = frame.f_code.co_names[oparg]
+    frame.f_stack.append(getattr(frame.f_stack[-1], name))
+
+
+@handler(OpCode.IMPORT_STAR)
+def import_star(vm, frame, oparg):
+    module = frame.f_stack.pop()
+    for k, v in module.__dict__.items():
+        if not k.startswith('_'):
+            frame.f_locals[k] = v
+
+
+# 超级指令的参数是 (第一条指令的参数, 第二条指令的参数或运算函数)，
+# 第二条指令保留在原位置以便跳转，执行完后跳过它
+@handler(OpCode.LOAD_FAST__LOAD_FAST)
+def load_fast__load_fast(vm, frame, oparg):
+    a, b = oparg
+    fast_locals = frame.f_fast_locals
+    frame.f_stack.append(fast_locals[a])
+    frame.f_stack.append(fast_locals[b])
+    frame.f_lasti += 1
+
+
+@handler(OpCode.LOAD_CONST_VALUE)
+def load_const_value(vm, frame, oparg):
+    frame.f_stack.append(oparg)
+
+
+@handler(OpCode.COPY_CONST_MAP)
+def copy_const_map(vm, frame, oparg):
+    frame.f_stack.append(oparg.copy())
+
+
+@handler(OpCode.LOAD_FAST__LOAD_CONST)
+def load_fast__load_const(vm, frame, oparg):
+    a, b = oparg
+    frame.f_stack.append(frame.f_fast_locals[a])
+    frame.f_stack.append(frame.f_code.co_consts[b])
+    frame.f_lasti += 1
+
+
+@handler(OpCode.COMPARE_OP__POP_JUMP_IF_FALSE)
+def compare_op__pop_jump_if_false(vm, frame, oparg):
+    op, target = oparg
+    a, b = frame.f_stack.pop(), frame.f_stack.pop()
+    not_jump = COMPARE_MAP[op](b, a)
+    if not_jump:
+        frame.f_lasti += 1
+    else:
+        frame.f_lasti = target
+
+
+@handler(OpCode.FOR_ITER__STORE_FAST)
+def for_iter__store_fast(vm, frame, oparg):
+    target, b = oparg
+    try:
+        frame.f_fast_locals[b] = next(frame.f_stack[-1])
+    except StopIteration:
+        frame.f_stack.pop()
+        frame.f_lasti = target
+    else:
+        frame.f_lasti += 1
+
+
+@handler(OpCode.LOAD_CONST__BINARY_OP)
+def load_const__binary_op(vm, frame, oparg):
+    a, operator = oparg
+    frame.f_stack.append(operator(frame.f_stack.pop(), frame.f_code.co_consts[a]))
+    frame.f_lasti += 1
+
+
+@handler(OpCode.LOAD_FAST__BINARY_OP)
+def load_fast__binary_op(vm, frame, oparg):
+    a, operator = oparg
+    frame.f_stack.append(operator(frame.f_stack.pop(), frame.f_fast_locals[a]))
+    frame.f_lasti += 1
@@ -0,0 +1,234 @@
+import dis
+from collections import Counter
+from types import CodeType
+from typing import Any
+
+from src.function import CodeFlag
+from src.opcode import (BLOCK_SETUP, CONST_LOADS, JUMPS, TERMINATORS,
+                        UNCONDITIONAL_JUMPS, OpCode, stack_effect)
+
+# 优化级别：
+# 0 不优化
+# 1 跳转串联、删除不可达代码和 NOP、常量元组和常量字典折叠、BUILD_TUPLE + UNPACK_SEQUENCE 改写为 ROT_*
+# 2 另外删除只写一次读一次的临时局部变量（相邻的 STORE_FAST x; LOAD_FAST x），帧中看不到这些变量
+MAX_LEVEL = 2
+
+
+def successors(instrs: list[tuple[int, Any]], i: int) -> list[tuple[int, bool]]:
+    # 控制流的后继 (下标, 是否经由跳转)，块指令的处理代码也算作后继
+    opcode, oparg = instrs[i]
+    if opcode in TERMINATORS:
+        return []
+    if opcode in UNCONDITIONAL_JUMPS:
+        return [(oparg, True)]
+    if opcode in JUMPS:
+        return [(i + 1, False), (oparg, True)]
+    return [(i + 1, False)]
+
+
+def stack_depths(instrs: list[tuple[int, Any]]) -> list[int]:
+    # 校验器：每条指令执行前的值栈深度，不可达的为 None。
+    # 同一条指令从不同路径到达时深度必须相同，深度不能为负，也不能执行到指令序列之外
+    depths: list[int] = [None] * len(instrs)
+    start = 1 if instrs and instrs[0][0] == OpCode.GEN_START else 0
+    pending = [(0, start)]
+    while pending:
+        i, depth = pending.pop()
+        if i >= len(instrs):
+            raise ValueError('control flow runs off the end of the code')
+        if depths[i] is not None:
+            if depths[i] != depth:
+                raise ValueError('inconsistent stack depth at {}: {} != {}'.format(i, depths[i], depth))
+            continue
+        if depth < 0:
+            raise ValueError('negative stack depth at {}'.format(i))
+        depths[i] = depth
+        opcode, oparg = instrs[i]
+        if opcode in BLOCK_SETUP:
+            # 处理代码开始时值栈为块的深度加上两组异常，见 codeinfo.block_table
+            level = depth if opcode == OpCode.SETUP_FINALLY else depth + stack_effect(opcode, 0, jump=False) - 1
+            pending.append((oparg, level + 6))
+            pending.append((i + 1, depth + stack_effect(opcode, 0, jump=False)))
+            continue
+        for target, jumped in successors(instrs, i):
+            pending.append((target, depth + stack_effect(opcode, oparg, jump=jumped)))
+    return depths
+
+
+def jump_targets(instrs: list[tuple[int, Any]]) -> set[int]:
+    return {oparg for opcode, oparg in instrs if opcode in JUMPS}
+
+
+def const_value(code: CodeType, instr: tuple[int, Any]) -> Any:
+    opcode, oparg = instr
+    return code.co_consts[oparg] if opcode == OpCode.LOAD_CONST else oparg
+
+
+def fold_constants(code: CodeType, instrs: list[tuple[int, Any]], targets: set[int], stats: Counter):
+    # n 条常量加载 + BUILD_TUPLE n 改写为一条加载常量元组的指令；
+    # n + 1 条常量加载 + BUILD_CONST_KEY_MAP n 改写为复制模板字典的指令，每次执行仍然得到新的字典。
+    # 新指令放在第一条加载的位置，其余的改为 NOP，中间不能有跳转目标
+    for i, (opcode, oparg) in enumerate(instrs):
+        if opcode == OpCode.BUILD_TUPLE:
+            count = oparg
+        elif opcode == OpCode.BUILD_CONST_KEY_MAP:
+            count = oparg + 1
+        else:
+            continue
+        start = i - count
+        if start < 0 or any(instrs[j][0] not in CONST_LOADS for j in range(start, i)):
+            continue
+        if any(j in targets for j in range(start + 1, i + 1)):
+            continue
+        values = [const_value(code, instrs[j]) for j in range(start, i)]
+        if opcode == OpCode.BUILD_TUPLE:
+            folded = (OpCode.LOAD_CONST_VALUE, tuple(values))
+        else:
+            try:
+                folded = (OpCode.COPY_CONST_MAP, dict(zip(values[-1], values[:-1])))
+            except TypeError:
+                continue
+        instrs[start:i + 1] = [folded] + [(OpCode.NOP, 0)] * count
+        stats['fold ' + dis.opname[opcode]] += 1
+
+
+def replace_swaps(instrs: list[tuple[int, Any]], targets: set[int], stats: Counter):
+    # a, b = b, a 这类交换：BUILD_TUPLE/BUILD_LIST n; UNPACK_SEQUENCE n 不需要创建中间的序列。
+    # CPython 3.10 的编译器已经对 n = 2、3 的元组做了同样的改写，这里处理剩下的情况
+    rotations = {1: [], 2: [(OpCode.ROT_TWO, 0)], 3: [(OpCode.ROT_THREE, 0), (OpCode.ROT_TWO, 0)]}
+    for i in range(len(instrs) - 1):
+        (first, n), (second, m) = instrs[i], instrs[i + 1]
+        if first not in (OpCode.BUILD_TUPLE, OpCode.BUILD_LIST) or second != OpCode.UNPACK_SEQUENCE:
+            continue
+        if n != m or n not in rotations or i + 1 in targets:
+            continue
+        replacement = rotations[n]
+        instrs[i:i + 2] = replacement + [(OpCode.NOP, 0)] * (2 - len(replacement))
+        stats['swap'] += 1
+
+
+def parameter_count(code: CodeType) -> int:
+    # 快速局部变量中参数的个数，参数在帧创建时已经赋值
+    nparams = code.co_argcount + code.co_kwonlyargcount
+    return nparams + bool(code.co_flags & CodeFlag.VARARGS) + bool(code.co_flags & CodeFlag.VARKEYWORDS)
+
+
+def remove_temporaries(code: CodeType, instrs: list[tuple[int, Any]], targets: set[int], stats: Counter):
+    # x = f(); return x 中的 x：整个代码对象中只写一次、读一次，并且读紧跟在写之后，两条指令都可以删除。
+    # 参数、被删除过的变量不参与；单元变量不使用 STORE_FAST，不受影响。
+    # x = x 这样的自我赋值只对没有被删除过的参数删除，其他变量可能未赋值，读取时要抛出 UnboundLocalError
+    nparams = parameter_count(code)
+    uses = Counter((opcode, oparg) for opcode, oparg in instrs
+                   if opcode in (OpCode.STORE_FAST, OpCode.LOAD_FAST, OpCode.DELETE_FAST))
+    for i in range(len(instrs) - 1):
+        (first, a), (second, b) = instrs[i], instrs[i + 1]
+        if a != b or i + 1 in targets:
+            continue
+        if first == OpCode.STORE_FAST and second == OpCode.LOAD_FAST:
+            if a < nparams or uses[OpCode.STORE_FAST, a] != 1 or uses[OpCode.LOAD_FAST, a] != 1 \
+                    or uses[OpCode.DELETE_FAST, a]:
+                continue
+        elif not (first == OpCode.LOAD_FAST and second == OpCode.STORE_FAST) \
+                or a >= nparams or uses[OpCode.DELETE_FAST, a]:
+            continue
+        instrs[i] = instrs[i + 1] = (OpCode.NOP, 0)
+        stats['temporary'] += 1
+
+
+def resolve(instrs: list[tuple[int, Any]], target: int) -> int:
+    # 跳过 NOP，沿无条件跳转找到最终的目标，跳转成环时停在环上
+    seen = set()
+    while target < len(instrs) and target not in seen:
+        seen.add(target)
+        opcode, oparg = instrs[target]
+        if opcode == OpCode.NOP:
+            target += 1
+        elif opcode in UNCONDITIONAL_JUMPS:
+            target = oparg
+        else:
+            break
+    return target
+
+
+def thread_jumps(instrs: list[tuple[int, Any]], stats: Counter):
+    # 块指令的目标是处理代码的入口，保持不变
+    for i, (opcode, oparg) in enumerate(instrs):
+        if opcode not in JUMPS or opcode in BLOCK_SETUP:
+            continue
+        target = resolve(instrs, oparg)
+        if target == oparg or target >= len(instrs):
+            continue
+        if opcode == OpCode.JUMP_FORWARD and target <= i:
+            opcode = OpCode.JUMP_ABSOLUTE
+        instrs[i] = (opcode, target)
+        stats['thread'] += 1
+
+
+def remove_dead_code(instrs: list[tuple[int, Any]], stats: Counter):
+    reachable = [False] * len(instrs)
+    pending = [0]
+    while pending:
+        i = pending.pop()
+        while i < len(instrs) and not reachable[i]:
+            reachable[i] = True
+            opcode, oparg = instrs[i]
+            if opcode in BLOCK_SETUP:
+                pending.append(oparg)
+            nexts = successors(instrs, i)
+            if not nexts:
+                break
+            pending.extend(target for target, jumped in nexts if jumped)
+            if nexts[0][1]:
+                break
+            i += 1
+    for i, live in enumerate(reachable):
+        if not live and instrs[i][0] != OpCode.NOP:
+            instrs[i] = (OpCode.NOP, 0)
+            stats['dead'] += 1
+
+
+def remove_jumps_to_next(instrs: list[tuple[int, Any]], stats: Counter):
+    for i, (opcode, oparg) in enumerate(instrs):
+        if opcode in UNCONDITIONAL_JUMPS and oparg > i and all(
+                instrs[j][0] == OpCode.NOP for j in range(i + 1, oparg)):
+            instrs[i] = (OpCode.NOP, 0)
+            stats['jump to next'] += 1
+
+
+def compact(instrs: list[tuple[int, Any]], offsets: list[int]) -> tuple[list, list[int]]:
+    # 删除 NOP 并重新计算跳转目标，跳到 NOP 的改为跳到它之后第一条保留的指令。
+    # 保留的指令沿用原来的字节偏移，行号、回溯和可视化不受影响
+    new_index = []
+    kept = 0
+    for opcode, _ in instrs:
+        new_index.append(kept)
+        kept += opcode != OpCode.NOP
+    new_index.append(kept)
+    result, result_offsets = [], []
+    for (opcode, oparg), offset in zip(instrs, offsets):
+        if opcode == OpCode.NOP:
+            continue
+        if opcode in JUMPS:
+            oparg = new_index[oparg]
+        result.append((opcode, oparg))
+        result_offsets.append(offset)
+    return result, result_offsets
+
+
+def optimize(code: CodeType, instrs: list[tuple[int, Any]], offsets: list[int],
+             level: int) -> tuple[list, list[int], Counter]:
+    # 在 decode 之后、合并超级指令之前对解码后的指令进行，返回新的指令、偏移和各项优化发生的次数
+    stats = Counter()
+    if level <= 0:
+        return instrs, offsets, stats
+    instrs = list(instrs)
+    targets = jump_targets(instrs)
+    fold_constants(code, instrs, targets, stats)
+    replace_swaps(instrs, targets, stats)
+    if level >= 2:
+        remove_temporaries(code, instrs, targets, stats)
+    thread_jumps(instrs, stats)
+    remove_dead_code(instrs, stats)
+    remove_jumps_to_next(instrs, stats)
+    instrs, offsets = compact(instrs, offsets)
+    return instrs, offsets, stats
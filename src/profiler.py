@@ -0,0 +1,209 @@
+import json
+import marshal
+from time import perf_counter
+from types import CodeType
+
+from src.codeinfo import get_code_info
+from src.frame import Frame
+from src.opcode import OPNAMES
+
+# 指令计时数组多出的一格，记录进入帧到执行第一条指令之间的时间
+SETUP = -1
+SETUP_OPCODE = 256
+
+
+def code_key(code: CodeType) -> tuple[str, int, str]:
+    # 与 pstats 的函数键相同
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class CodeProfile:
+    # 一个代码对象的统计，按指令下标计数和计时，报告时再按行汇总
+    __slots__ = ('code', 'counts', 'times', 'calls', 'primitive_calls',
+                 'inclusive', 'exclusive', 'active', 'callers')
+
+    def __init__(self, code: CodeType) -> None:
+        n = len(get_code_info(code).instrs)
+        self.code = code
+        self.counts = [0] * n
+        self.times = [0.0] * (n + 1)
+        self.calls = 0
+        self.primitive_calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        # 正在执行的次数，递归时只在最外层累计包含时间
+        self.active = 0
+        # 调用者的键 -> [primitive_calls, calls, exclusive, inclusive]
+        self.callers: dict[tuple, list] = {}
+
+    def line_stats(self) -> dict[int, list]:
+        # 行号 -> [执行次数, 时间]
+        offsets = get_code_info(self.code).offsets
+        line_of = {}
+        for start, end, line in self.code.co_lines():
+            for offset in range(start, end, 2):
+                line_of[offset] = line
+        lines = {}
+        for i, offset in enumerate(offsets):
+            line = line_of.get(offset)
+            if line is None or not self.counts[i]:
+                continue
+            stats = lines.setdefault(line, [0, 0.0])
+            stats[0] += self.counts[i]
+            stats[1] += self.times[i]
+        return lines
+
+
+class Activation:
+    # 一次帧的执行（生成器每次恢复都是一次新的 Activation）
+    __slots__ = ('frame', 'profile', 'caller', 'call', 'primitive', 'start', 'children', 'index', 'opcode')
+
+    def __init__(self, frame: Frame, profile: CodeProfile, caller: tuple, start: float) -> None:
+        self.frame = frame
+        self.profile = profile
+        self.caller = caller
+        # 生成器恢复执行不算新的调用
+        self.call = not frame.f_lasti
+        self.primitive = not profile.active
+        self.start = start
+        self.children = 0.0
+        self.index = SETUP
+        self.opcode = SETUP_OPCODE
+
+
+class Profiler:
+    # instruction 作为 Interpreter.hook，frame_event 作为 Interpreter.frame_hook。
+    # 两次 instruction 调用之间的时间计入前一条指令
+
+    def __init__(self) -> None:
+        self.profiles: dict[int, CodeProfile] = {}
+        self.opcode_counts = [0] * (SETUP_OPCODE + 1)
+        self.opcode_times = [0.0] * (SETUP_OPCODE + 1)
+        self.stack: list[Activation] = []
+        self.last_time = perf_counter()
+
+    def attach(self, interpreter):
+        interpreter.hook = self.instruction
+        interpreter.frame_hook = self.frame_event
+
+    def get_profile(self, code: CodeType) -> CodeProfile:
+        profile = self.profiles.get(id(code))
+        if profile is None:
+            profile = self.profiles[id(code)] = CodeProfile(code)
+        return profile
+
+    def flush(self, now: float):
+        if self.stack:
+            activation = self.stack[-1]
+            elapsed = now - self.last_time
+            activation.profile.times[activation.index] += elapsed
+            self.opcode_times[activation.opcode] += elapsed
+        self.last_time = now
+
+    def instruction(self, frame: Frame):
+        now = perf_counter()
+        activation = self.stack[-1]
+        profile = activation.profile
+        elapsed = now - self.last_time
+        profile.times[activation.index] += elapsed
+        self.opcode_times[activation.opcode] += elapsed
+        i = frame.f_lasti
+        opcode = frame.f_instrs[i][0]
+        profile.counts[i] += 1
+        self.opcode_counts[opcode] += 1
+        activation.index = i
+        activation.opcode = opcode
+        self.last_time = perf_counter()
+
+    def frame_event(self, frame: Frame, event: str):
+        now = perf_counter()
+        self.flush(now)
+        if event == 'call':
+            profile = self.get_profile(frame.f_code)
+            caller = code_key(self.stack[-1].profile.code) if self.stack else None
+            activation = Activation(frame, profile, caller, now)
+            if activation.call:
+                profile.calls += 1
+                profile.primitive_calls += activation.primitive
+            profile.active += 1
+            self.stack.append(activation)
+        else:
+            # 异常离开的帧没有 return 事件，一直弹出到当前帧
+            while self.stack:
+                activation = self.stack.pop()
+                self.leave(activation, now)
+                if activation.frame is frame:
+                    break
+        self.last_time = perf_counter()
+
+    def leave(self, activation: Activation, now: float):
+        profile = activation.profile
+        inclusive = now - activation.start
+        exclusive = inclusive - activation.children
+        profile.active -= 1
+        profile.exclusive += exclusive
+        if activation.primitive:
+            profile.inclusive += inclusive
+        if self.stack:
+            self.stack[-1].children += inclusive
+        if activation.caller is not None:
+            edge = profile.callers.setdefault(activation.caller, [0, 0, 0.0, 0.0])
+            if activation.call:
+                edge[0] += activation.primitive
+                edge[1] += 1
+            edge[2] += exclusive
+            if activation.primitive:
+                edge[3] += inclusive
+
+    def to_pstats(self) -> dict:
+        stats = {}
+        for profile in self.profiles.values():
+            if not profile.calls:
+                continue
+            stats[code_key(profile.code)] = (
+                profile.primitive_calls, profile.calls, profile.exclusive, profile.inclusive,
+                {caller: tuple(edge) for caller, edge in profile.callers.items()})
+        return stats
+
+    def dump_pstats(self, path: str):
+        # pstats.Stats(path) 可以直接读取
+        with open(path, 'wb') as outfile:
+            marshal.dump(self.to_pstats(), outfile)
+
+    def to_json(self) -> dict:
+        opcodes = [
+            {'opcode': OPNAMES.get(opcode, str(opcode)), 'count': count, 'time': self.opcode_times[opcode]}
+            for opcode, count in enumerate(self.opcode_counts[:SETUP_OPCODE]) if count]
+        codes, lines = [], []
+        for profile in self.profiles.values():
+            filename, firstlineno, name = code_key(profile.code)
+            codes.append({
+                'name': name, 'filename': filename, 'firstlineno': firstlineno,
+                'instructions': sum(profile.counts), 'time': sum(profile.times),
+                'calls': profile.calls, 'primitive_calls': profile.primitive_calls,
+                'inclusive': profile.inclusive, 'exclusive': profile.exclusive,
+            })
+            for line, (count, time) in sorted(profile.line_stats().items()):
+                lines.append({'filename': filename, 'line': line, 'name': name,
+                              'count': count, 'time': time})
+        return {'opcodes': opcodes, 'code_objects': codes, 'lines': lines}
+
+    def dump_json(self, path: str):
+        with open(path, 'w') as outfile:
+            json.dump(self.to_json(), outfile, indent=2)
+
+    def report(self, limit: int = 15) -> str:
+        data = self.to_json()
+        lines = ['{:<40} {:>12} {:>12}'.format('Opcode', 'count', 'time (ms)')]
+        for item in sorted(data['opcodes'], key=lambda item: -item['time'])[:limit]:
+            lines.append('    {:<36} {:>12} {:>12.3f}'.format(item['opcode'], item['count'], item['time'] * 1e3))
+        lines.append('{:<40} {:>12} {:>12} {:>12}'.format('Function', 'calls', 'incl (ms)', 'excl (ms)'))
+        for item in sorted(data['code_objects'], key=lambda item: -item['exclusive'])[:limit]:
+            lines.append('    {:<36} {:>12} {:>12.3f} {:>12.3f}'.format(
+                '{} ({}:{})'.format(item['name'], item['filename'], item['firstlineno'])[-36:],
+                item['calls'], item['inclusive'] * 1e3, item['exclusive'] * 1e3))
+        lines.append('{:<40} {:>12} {:>12}'.format('Line', 'count', 'time (ms)'))
+        for item in sorted(data['lines'], key=lambda item: -item['time'])[:limit]:
+            lines.append('    {:<36} {:>12} {:>12.3f}'.format(
+                '{}:{}'.format(item['filename'], item['line'])[-36:], item['count'], item['time'] * 1e3))
+        return '\n'.join(lines)
@@ -0,0 +1,66 @@
+import threading
+from collections import Counter
+from types import CodeType
+
+from src.codeinfo import get_code_info
+
+# 防止读到正在被复用的帧时链表成环
+MAX_DEPTH = 1000
+
+
+class Sampler:
+    # 后台线程定时读取 Interpreter.frame -> f_back 链，解释器的执行循环不需要任何改动
+
+    def __init__(self, interpreter, rate: float = 100) -> None:
+        self.interpreter = interpreter
+        self.interval = 1 / rate
+        # 从最外层到最内层的 (代码对象, 指令下标) 序列 -> 采样次数
+        self.samples: Counter = Counter()
+        self.lines: dict[CodeType, list[int]] = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        stack = []
+        frame = self.interpreter.frame
+        while frame is not None and len(stack) < MAX_DEPTH:
+            # f_lasti 指向下一条指令，外层帧的 f_lasti - 1 是正在进行的调用
+            stack.append((frame.f_code, max(frame.f_lasti - 1, 0)))
+            frame = frame.f_back
+        if stack:
+            self.samples[tuple(reversed(stack))] += 1
+
+    def line_of(self, code: CodeType, index: int) -> int:
+        lines = self.lines.get(code)
+        if lines is None:
+            line_at = {}
+            for start, end, line in code.co_lines():
+                for offset in range(start, end, 2):
+                    line_at[offset] = line
+            lines = self.lines[code] = [
+                line_at.get(offset) or code.co_firstlineno for offset in get_code_info(code).offsets]
+        return lines[index]
+
+    def collapsed(self) -> list[str]:
+        # flamegraph.pl / speedscope 可以读取的折叠栈格式
+        stacks = Counter()
+        for stack, count in self.samples.items():
+            stacks[';'.join('{} ({}:{})'.format(code.co_name, code.co_filename, self.line_of(code, index))
+                            for code, index in stack)] += count
+        return ['{} {}'.format(stack, count) for stack, count in sorted(stacks.items())]
+
+    def dump(self, path: str):
+        with open(path, 'w') as outfile:
+            for line in self.collapsed():
+                outfile.write(line + '\n')
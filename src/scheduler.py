@@ -0,0 +1,164 @@
+import io
+import sys
+import threading
+import time
+from collections import deque
+from functools import partial
+from itertools import chain, islice, repeat
+from types import CodeType
+from typing import Any, Callable, Iterator
+
+from src.function import Generator
+from src.interpreter import Interpreter
+
+# iter(callable, sentinel) 的哨兵，回调永远不会返回它
+_SENTINEL = object()
+
+
+def slices(budget: int, callback: Callable) -> Iterator:
+    # 每 budget 条指令调用一次 callback() 的无限迭代器：budget - 1 个 None 之后是一次 callback 调用。
+    # hook 为 partial(next, 迭代器)，逐条指令只在 C 中推进迭代器，不调用 Python 函数
+    calls = iter(callback, _SENTINEL)
+    return chain.from_iterable(map(
+        chain,
+        map(islice, repeat(repeat(None)), repeat(budget - 1)),
+        map(islice, repeat(calls), repeat(1))))
+
+
+def percentiles(values: list[float], points: tuple = (50, 90, 99)) -> dict[int, float]:
+    values = sorted(values)
+    if not values:
+        return {point: 0.0 for point in points}
+    return {point: values[min(len(values) - 1, len(values) * point // 100)] for point in points}
+
+
+class Task:
+    # 每个任务在自己的宿主线程上执行，线程只用来保存嵌套 eval_frame 的宿主调用栈，
+    # 调度器保证任何时刻只有一个任务在运行，切换点由指令预算决定
+    __slots__ = ('name', 'target', 'output', 'result', 'exception', 'done', 'thread', 'wake', 'hook',
+                 'frame', 'exc_info', 'spawned', 'ready_at', 'finished', 'waits', 'slices')
+
+    def __init__(self, name: str, target: Callable) -> None:
+        self.name = name
+        self.target = target
+        self.output = io.StringIO()
+        self.result = None
+        self.exception = None
+        self.done = False
+        self.thread = None
+        # 作为二值信号量使用的锁，初始为已获取状态，调度器释放它让任务继续运行。
+        # threading.Semaphore 用 Python 实现，切换开销大得多
+        self.wake = threading.Lock()
+        self.wake.acquire()
+        self.hook = None
+        # 任务被切换出去时保存的 Interpreter.frame 和正在处理的异常 Interpreter.exc_info
+        self.frame = None
+        self.exc_info = None
+        self.spawned = self.ready_at = time.perf_counter()
+        self.finished = None
+        # 每次从就绪到开始运行的等待时间
+        self.waits = []
+        self.slices = 0
+
+    @property
+    def turnaround(self) -> float:
+        return self.finished - self.spawned
+
+    def __repr__(self):
+        return '<Task {}>'.format(self.name)
+
+
+class Scheduler:
+
+    def __init__(self, interpreter: Interpreter = None, budget: int = 1000) -> None:
+        self.interpreter = interpreter if interpreter is not None else Interpreter()
+        self.budget = budget
+        self.ready = deque()
+        self.tasks = []
+        self.current = None
+        # 运行中的任务让出或结束时释放，调度循环在上面等待
+        self.yielded = threading.Lock()
+        self.yielded.acquire()
+
+    def spawn(self, target: Any, *args: Any, name: str = None) -> Task:
+        # target 可以是模块代码对象、可调用对象（VM 函数或宿主函数）或 VM 生成器
+        if isinstance(target, CodeType):
+            run = partial(self.interpreter.run, target)
+        elif isinstance(target, Generator):
+            run = partial(list, target)
+        else:
+            run = partial(target, *args)
+        task = Task(name or 'task-{}'.format(len(self.tasks)), run)
+        task.hook = partial(next, slices(self.budget, self.switch))
+        self.tasks.append(task)
+        self.ready.append(task)
+        return task
+
+    def switch(self):
+        # 在任务线程中由 hook 调用。没有其他就绪任务时直接开始下一个时间片
+        if not self.ready:
+            return
+        task = self.current
+        self.yielded.release()
+        task.wake.acquire()
+
+    def main(self, task: Task):
+        task.wake.acquire()
+        try:
+            task.result = task.target()
+        except BaseException as ex:
+            task.exception = ex
+        task.done = True
+        self.yielded.release()
+
+    def run(self):
+        interpreter = self.interpreter
+        stdout = sys.stdout
+        hook = interpreter.hook
+        exc_info = interpreter.exc_info
+        try:
+            while self.ready:
+                task = self.ready.popleft()
+                now = time.perf_counter()
+                task.waits.append(now - task.ready_at)
+                task.slices += 1
+                self.current = task
+                interpreter.frame = task.frame
+                interpreter.exc_info = task.exc_info
+                interpreter.hook = task.hook
+                sys.stdout = task.output
+                if task.thread is None:
+                    task.thread = threading.Thread(target=self.main, args=(task,), name=task.name, daemon=True)
+                    task.thread.start()
+                task.wake.release()
+                self.yielded.acquire()
+                if task.done:
+                    task.finished = time.perf_counter()
+                    task.frame = task.exc_info = None
+                    task.thread.join()
+                else:
+                    task.frame = interpreter.frame
+                    task.exc_info = interpreter.exc_info
+                    task.ready_at = time.perf_counter()
+                    self.ready.append(task)
+        finally:
+            self.current = None
+            interpreter.frame = None
+            interpreter.exc_info = exc_info
+            interpreter.hook = hook
+            sys.stdout = stdout
+
+    def latency_report(self) -> str:
+        lines = ['{:<16} {:>7} {:>10} {:>10} {:>10} {:>12}'.format(
+            'task', 'slices', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'total (ms)')]
+        waits = []
+        for task in self.tasks:
+            waits += task.waits
+            points = percentiles(task.waits)
+            lines.append('{:<16} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>12.3f}'.format(
+                task.name, task.slices, points[50] * 1e3, points[90] * 1e3, points[99] * 1e3,
+                task.turnaround * 1e3 if task.done else float('nan')))
+        points = percentiles(waits)
+        lines.append('{:<16} {:>7} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+            'all', len(waits), points[50] * 1e3, points[90] * 1e3, points[99] * 1e3))
+        return '\n'.join(lines)
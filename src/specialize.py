@@ -0,0 +1,325 @@
+from collections import Counter, defaultdict
+from functools import wraps
+
+from src.function import Generator
+from src.opcode import COMPARE_MAP, HANDLERS, OPNAMES, OpCode, handler
+
+# 第一次尝试特化之前的执行次数
+WARMUP = 8
+# 特化指令允许的未命中次数，用完后回退为 ADAPTIVE
+MISS_BUDGET = 16
+# 特化失败或回退超过这个次数后，永久恢复为通用指令
+MAX_BACKOFF = 6
+
+range_iterator = type(iter(range(0)))
+list_iterator = type(iter([]))
+
+# (通用指令, 操作数类型) -> 特化指令。二元运算和比较的类型是 (左操作数, 右操作数)，
+# 下标是 (容器, 下标)，FOR_ITER 是迭代器
+SPECIALIZATIONS = {}
+for opcode in (OpCode.BINARY_ADD, OpCode.INPLACE_ADD):
+    SPECIALIZATIONS[opcode, (int, int)] = OpCode.BINARY_ADD_INT
+    SPECIALIZATIONS[opcode, (float, float)] = OpCode.BINARY_ADD_FLOAT
+    SPECIALIZATIONS[opcode, (str, str)] = OpCode.BINARY_ADD_STR
+for opcode in (OpCode.BINARY_SUBTRACT, OpCode.INPLACE_SUBTRACT):
+    SPECIALIZATIONS[opcode, (int, int)] = OpCode.BINARY_SUBTRACT_INT
+    SPECIALIZATIONS[opcode, (float, float)] = OpCode.BINARY_SUBTRACT_FLOAT
+for opcode in (OpCode.BINARY_MULTIPLY, OpCode.INPLACE_MULTIPLY):
+    SPECIALIZATIONS[opcode, (int, int)] = OpCode.BINARY_MULTIPLY_INT
+    SPECIALIZATIONS[opcode, (float, float)] = OpCode.BINARY_MULTIPLY_FLOAT
+SPECIALIZATIONS.update({
+    (OpCode.BINARY_SUBSCR, (list, int)): OpCode.BINARY_SUBSCR_LIST_INT,
+    (OpCode.BINARY_SUBSCR, (tuple, int)): OpCode.BINARY_SUBSCR_TUPLE_INT,
+    (OpCode.BINARY_SUBSCR, (dict, str)): OpCode.BINARY_SUBSCR_DICT,
+    (OpCode.COMPARE_OP, (int, int)): OpCode.COMPARE_OP_INT,
+    (OpCode.COMPARE_OP, (float, float)): OpCode.COMPARE_OP_FLOAT,
+    (OpCode.COMPARE_OP, (str, str)): OpCode.COMPARE_OP_STR,
+    (OpCode.COMPARE_OP__POP_JUMP_IF_FALSE, (int, int)): OpCode.COMPARE_OP_INT__POP_JUMP_IF_FALSE,
+    (OpCode.COMPARE_OP__POP_JUMP_IF_FALSE, (float, float)): OpCode.COMPARE_OP_FLOAT__POP_JUMP_IF_FALSE,
+    (OpCode.COMPARE_OP__POP_JUMP_IF_FALSE, (str, str)): OpCode.COMPARE_OP_STR__POP_JUMP_IF_FALSE,
+    (OpCode.FOR_ITER, range_iterator): OpCode.FOR_ITER_RANGE,
+    (OpCode.FOR_ITER, list_iterator): OpCode.FOR_ITER_LIST,
+    (OpCode.FOR_ITER__STORE_FAST, range_iterator): OpCode.FOR_ITER_RANGE__STORE_FAST,
+    (OpCode.FOR_ITER__STORE_FAST, list_iterator): OpCode.FOR_ITER_LIST__STORE_FAST,
+    (OpCode.FOR_ITER, Generator): OpCode.FOR_ITER_GENERATOR,
+    (OpCode.FOR_ITER__STORE_FAST, Generator): OpCode.FOR_ITER_GENERATOR__STORE_FAST,
+})
+
+# 加载时改写为 ADAPTIVE 的指令
+ADAPTIVE_OPCODES = frozenset(opcode for opcode, _ in SPECIALIZATIONS)
+SPECIALIZED_OPCODES = frozenset(SPECIALIZATIONS.values())
+
+# 指令名 -> 计数。通用指令记录 specializations/failures，
+# 特化指令记录 misses/deopts，enable_stats() 之后还会记录 executions
+stats: 'defaultdict[str, Counter]' = defaultdict(Counter)
+_stats_enabled = False
+
+
+class AdaptiveCache:
+    # ADAPTIVE 和特化指令的内联缓存，保存原来的指令以便回退。
+    # counter 在 ADAPTIVE 下是距离下次尝试特化的执行次数，在特化指令下是剩余的未命中次数
+    __slots__ = ('opcode', 'oparg', 'counter', 'backoff', 'operator')
+
+    def __init__(self, opcode: int, oparg) -> None:
+        self.opcode = opcode
+        self.oparg = oparg
+        self.counter = WARMUP
+        self.backoff = 0
+        self.operator = None
+
+    def __repr__(self):
+        return '<AdaptiveCache {}>'.format(OPNAMES[self.opcode])
+
+
+def operand_types(opcode: int, stack: list):
+    if opcode in (OpCode.FOR_ITER, OpCode.FOR_ITER__STORE_FAST):
+        return type(stack[-1])
+    return type(stack[-2]), type(stack[-1])
+
+
+def specialize(frame, cache: AdaptiveCache):
+    i = frame.f_lasti - 1
+    opcode = cache.opcode
+    specialized = SPECIALIZATIONS.get((opcode, operand_types(opcode, frame.f_stack)))
+    if specialized is None:
+        stats[OPNAMES[opcode]]['failures'] += 1
+        back_off(frame.f_instrs, i, cache)
+        return
+    if opcode == OpCode.COMPARE_OP:
+        cache.operator = COMPARE_MAP[cache.oparg]
+    elif opcode == OpCode.COMPARE_OP__POP_JUMP_IF_FALSE:
+        cache.operator = COMPARE_MAP[cache.oparg[0]]
+    stats[OPNAMES[opcode]]['specializations'] += 1
+    cache.counter = MISS_BUDGET
+    frame.f_instrs[i] = (specialized, cache)
+
+
+def back_off(instrs: list, i: int, cache: AdaptiveCache):
+    # 失败次数越多，下次尝试特化之前等待越久
+    cache.backoff += 1
+    if cache.backoff > MAX_BACKOFF:
+        instrs[i] = (cache.opcode, cache.oparg)
+    else:
+        instrs[i] = (OpCode.ADAPTIVE, cache)
+        cache.counter = WARMUP << cache.backoff
+
+
+def miss(vm, frame, cache: AdaptiveCache):
+    # 类型检查失败，按通用指令执行，未命中次数用完则回退
+    i = frame.f_lasti - 1
+    counts = stats[OPNAMES[frame.f_instrs[i][0]]]
+    counts['misses'] += 1
+    cache.counter -= 1
+    if not cache.counter:
+        counts['deopts'] += 1
+        back_off(frame.f_instrs, i, cache)
+    return HANDLERS[cache.opcode](vm, frame, cache.oparg)
+
+
+@handler(OpCode.ADAPTIVE)
+def adaptive(vm, frame, cache):
+    cache.counter -= 1
+    if not cache.counter:
+        specialize(frame, cache)
+    return HANDLERS[cache.opcode](vm, frame, cache.oparg)
+
+
+# 特化指令先检查类型再修改栈，未命中时栈保持原样交给通用指令
+
+
+def add_handler(tp):
+    def handler(vm, frame, cache):
+        stack = frame.f_stack
+        a = stack[-1]
+        b = stack[-2]
+        if type(a) is not tp or type(b) is not tp:
+            return miss(vm, frame, cache)
+        del stack[-1]
+        stack[-1] = b + a
+    return handler
+
+
+def subtract_handler(tp):
+    def handler(vm, frame, cache):
+        stack = frame.f_stack
+        a = stack[-1]
+        b = stack[-2]
+        if type(a) is not tp or type(b) is not tp:
+            return miss(vm, frame, cache)
+        del stack[-1]
+        stack[-1] = b - a
+    return handler
+
+
+def multiply_handler(tp):
+    def handler(vm, frame, cache):
+        stack = frame.f_stack
+        a = stack[-1]
+        b = stack[-2]
+        if type(a) is not tp or type(b) is not tp:
+            return miss(vm, frame, cache)
+        del stack[-1]
+        stack[-1] = b * a
+    return handler
+
+
+def subscr_handler(tp, index_tp):
+    def handler(vm, frame, cache):
+        stack = frame.f_stack
+        index = stack[-1]
+        obj = stack[-2]
+        if type(obj) is not tp or type(index) is not index_tp:
+            return miss(vm, frame, cache)
+        value = obj[index]
+        del stack[-1]
+        stack[-1] = value
+    return handler
+
+
+def compare_handler(tp):
+    def handler(vm, frame, cache):
+        stack = frame.f_stack
+        a = stack[-1]
+        b = stack[-2]
+        if type(a) is not tp or type(b) is not tp:
+            return miss(vm, frame, cache)
+        del stack[-1]
+        stack[-1] = cache.operator(b, a)
+    return handler
+
+
+def compare_jump_handler(tp):
+    # 同类型的内置类型比较结果一定是 bool
+    def handler(vm, frame, cache):
+        stack = frame.f_stack
+        a = stack[-1]
+        b = stack[-2]
+        if type(a) is not tp or type(b) is not tp:
+            return miss(vm, frame, cache)
+        del stack[-2:]
+        if cache.operator(b, a):
+            frame.f_lasti += 1
+        else:
+            frame.f_lasti = cache.oparg[1]
+    return handler
+
+
+def for_iter_handler(tp):
+    def handler(vm, frame, cache):
+        itor = frame.f_stack[-1]
+        if type(itor) is not tp:
+            return miss(vm, frame, cache)
+        try:
+            frame.f_stack.append(next(itor))
+        except StopIteration:
+            frame.f_stack.pop()
+            frame.f_lasti = cache.oparg
+    return handler
+
+
+def for_iter_store_fast_handler(tp):
+    def handler(vm, frame, cache):
+        itor = frame.f_stack[-1]
+        if type(itor) is not tp:
+            return miss(vm, frame, cache)
+        target, b = cache.oparg
+        try:
+            frame.f_fast_locals[b] = next(itor)
+        except StopIteration:
+            frame.f_stack.pop()
+            frame.f_lasti = target
+        else:
+            frame.f_lasti += 1
+    return handler
+
+
+@handler(OpCode.FOR_ITER_GENERATOR)
+def for_iter_generator(vm, frame, cache):
+    # 直接恢复 VM 生成器，不经过 next() 和 StopIteration
+    gen = frame.f_stack[-1]
+    if type(gen) is not Generator:
+        return miss(vm, frame, cache)
+    if not gen.finished:
+        gen.started = True
+        value = gen.resume(None)
+        if not gen.finished:
+            frame.f_stack.append(value)
+            return
+    frame.f_stack.pop()
+    frame.f_lasti = cache.oparg
+
+
+@handler(OpCode.FOR_ITER_GENERATOR__STORE_FAST)
+def for_iter_generator__store_fast(vm, frame, cache):
+    gen = frame.f_stack[-1]
+    if type(gen) is not Generator:
+        return miss(vm, frame, cache)
+    if not gen.finished:
+        gen.started = True
+        value = gen.resume(None)
+        if not gen.finished:
+            frame.f_fast_locals[cache.oparg[1]] = value
+            frame.f_lasti += 1
+            return
+    frame.f_stack.pop()
+    frame.f_lasti = cache.oparg[0]
+
+
+for opcode, handler_ in (
+        (OpCode.BINARY_ADD_INT, add_handler(int)),
+        (OpCode.BINARY_ADD_FLOAT, add_handler(float)),
+        (OpCode.BINARY_ADD_STR, add_handler(str)),
+        (OpCode.BINARY_SUBTRACT_INT, subtract_handler(int)),
+        (OpCode.BINARY_SUBTRACT_FLOAT, subtract_handler(float)),
+        (OpCode.BINARY_MULTIPLY_INT, multiply_handler(int)),
+        (OpCode.BINARY_MULTIPLY_FLOAT, multiply_handler(float)),
+        (OpCode.BINARY_SUBSCR_LIST_INT, subscr_handler(list, int)),
+        (OpCode.BINARY_SUBSCR_TUPLE_INT, subscr_handler(tuple, int)),
+        (OpCode.BINARY_SUBSCR_DICT, subscr_handler(dict, str)),
+        (OpCode.COMPARE_OP_INT, compare_handler(int)),
+        (OpCode.COMPARE_OP_FLOAT, compare_handler(float)),
+        (OpCode.COMPARE_OP_STR, compare_handler(str)),
+        (OpCode.COMPARE_OP_INT__POP_JUMP_IF_FALSE, compare_jump_handler(int)),
+        (OpCode.COMPARE_OP_FLOAT__POP_JUMP_IF_FALSE, compare_jump_handler(float)),
+        (OpCode.COMPARE_OP_STR__POP_JUMP_IF_FALSE, compare_jump_handler(str)),
+        (OpCode.FOR_ITER_RANGE, for_iter_handler(range_iterator)),
+        (OpCode.FOR_ITER_LIST, for_iter_handler(list_iterator)),
+        (OpCode.FOR_ITER_RANGE__STORE_FAST, for_iter_store_fast_handler(range_iterator)),
+        (OpCode.FOR_ITER_LIST__STORE_FAST, for_iter_store_fast_handler(list_iterator)),
+):
+    HANDLERS[opcode] = handler_
+
+
+def counted(func, counts: Counter):
+    @wraps(func)
+    def handler(vm, frame, cache):
+        counts['executions'] += 1
+        return func(vm, frame, cache)
+    return handler
+
+
+def enable_stats():
+    # 统计特化指令的执行次数。默认不统计，特化指令没有额外开销
+    global _stats_enabled
+    if _stats_enabled:
+        return
+    _stats_enabled = True
+    for opcode in SPECIALIZED_OPCODES:
+        HANDLERS[opcode] = counted(HANDLERS[opcode], stats[OPNAMES[opcode]])
+
+
+def specialization_report() -> str:
+    lines = ['{:<40} {:>16} {:>10}'.format('Adaptive', 'specializations', 'failures')]
+    for opcode in sorted(ADAPTIVE_OPCODES):
+        counts = stats.get(OPNAMES[opcode])
+        if counts:
+            lines.append('    {:<36} {:>16} {:>10}'.format(
+                OPNAMES[opcode], counts['specializations'], counts['failures']))
+    lines.append('{:<40} {:>10} {:>10} {:>10}'.format('Specialized', 'hits', 'misses', 'deopts'))
+    for opcode in sorted(SPECIALIZED_OPCODES):
+        counts = stats.get(OPNAMES[opcode])
+        if counts:
+            lines.append('    {:<36} {:>10} {:>10} {:>10}'.format(
+                OPNAMES[opcode], counts['executions'] - counts['misses'],
+                counts['misses'], counts['deopts']))
+    return '\n'.join(lines)
@@ -0,0 +1,166 @@
+import curses
+import marshal
+import mmap
+import struct
+from types import CodeType
+
+from src.codeinfo import get_code_info
+from src.frame import Frame
+from src.opcode import OPNAMES
+from src.visualize import draw, get_repr
+
+# 文件头：魔数、版本、记录大小、记录数、尾部（代码对象表和栈快照）的偏移
+HEADER = struct.Struct('<8sHHQQ')
+# 每条记录：代码对象编号、f_lasti、执行的指令（可能是超级指令或特化指令）、栈深度
+RECORD = struct.Struct('<IIHH')
+MAGIC = b'TOYTRACE'
+VERSION = 2
+# 每次写入文件的记录数
+CHUNK_RECORDS = 4096
+
+
+class TraceRecorder:
+    # 作为 Interpreter.hook 使用，记录先写入固定大小的缓冲区，满了再整块写入文件
+
+    def __init__(self, path: str, snapshot_every: int = 0) -> None:
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, 0, 0))
+        self.chunk = bytearray(CHUNK_RECORDS * RECORD.size)
+        self.position = 0
+        self.count = 0
+        # 每隔 snapshot_every 条记录保存一次栈的内容，为 0 时不保存
+        self.snapshot_every = snapshot_every
+        self.snapshots: dict[int, tuple[str]] = {}
+        self.codes: list[CodeType] = []
+        # 每个代码对象的优化级别，回放时用同样的级别解码
+        self.levels: list[int] = []
+        self.code_indexes: dict[int, int] = {}
+        self.last_code = None
+        self.last_index = 0
+
+    def code_index(self, frame: Frame) -> int:
+        # 以 id 为键，codes 持有代码对象，id 不会被复用
+        code = frame.f_code
+        index = self.code_indexes.get(id(code))
+        if index is None:
+            index = self.code_indexes[id(code)] = len(self.codes)
+            self.codes.append(code)
+            self.levels.append(frame.f_code_info.optimize)
+        return index
+
+    def record(self, frame: Frame):
+        if frame.f_code is not self.last_code:
+            self.last_code = frame.f_code
+            self.last_index = self.code_index(frame)
+        lasti = frame.f_lasti
+        RECORD.pack_into(self.chunk, self.position, self.last_index, lasti,
+                         frame.f_instrs[lasti][0], len(frame.f_stack))
+        if self.snapshot_every and not self.count % self.snapshot_every:
+            self.snapshots[self.count] = tuple(get_repr(x) for x in frame.f_stack)
+        self.count += 1
+        self.position += RECORD.size
+        if self.position == len(self.chunk):
+            self.file.write(self.chunk)
+            self.position = 0
+
+    def close(self):
+        self.file.write(memoryview(self.chunk)[:self.position])
+        trailer = self.file.tell()
+        self.file.write(marshal.dumps((tuple(self.codes), tuple(self.levels), self.snapshots)))
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, self.count, trailer))
+        self.file.close()
+
+
+class TraceReader:
+    # 通过内存映射随机访问记录
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as infile:
+            self.mm = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.count, trailer = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError('{} is not a trace file of version {}'.format(path, VERSION))
+        self.codes, levels, self.snapshots = marshal.loads(self.mm[trailer:])
+        # 按记录时的优化级别创建 CodeInfo，ReplayFrame 中的 f_lasti 才能对应到同一条指令
+        for code, level in zip(self.codes, levels):
+            get_code_info(code, level)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i: int) -> tuple[CodeType, int, int, int]:
+        if not 0 <= i < self.count:
+            raise IndexError('trace record index out of range')
+        code_index, lasti, opcode, depth = RECORD.unpack_from(self.mm, HEADER.size + i * RECORD.size)
+        return self.codes[code_index], lasti, opcode, depth
+
+    def close(self):
+        self.mm.close()
+
+
+class ReplayFrame:
+    # 只提供 visualize.draw 用到的属性
+    __slots__ = ('f_code', 'f_code_info', 'f_lasti', 'f_stack')
+
+    def __init__(self, code: CodeType, lasti: int, stack: list[str]) -> None:
+        self.f_code = code
+        self.f_code_info = get_code_info(code)
+        self.f_lasti = lasti
+        self.f_stack = stack
+
+
+HELP = [
+    'n/Right: next  p/Left: previous',
+    'PgDn/PgUp: +/-1000  Home/End: first/last',
+    'Space: play/pause  +/-: play speed  q: quit',
+]
+
+
+def replay(stdscr: curses.window, path: str):
+    reader = TraceReader(path)
+    if not len(reader):
+        raise ValueError('{} has no records'.format(path))
+    drawer = draw(stdscr)
+    drawer.send(None)
+    position, playing, step = 0, False, 1
+    moves = {
+        ord('n'): 1, curses.KEY_RIGHT: 1,
+        ord('p'): -1, curses.KEY_LEFT: -1,
+        curses.KEY_NPAGE: 1000, curses.KEY_PPAGE: -1000,
+    }
+    while True:
+        code, lasti, opcode, depth = reader[position]
+        # 没有快照的位置只显示栈深度
+        stack = list(reader.snapshots.get(position, ('?',) * depth))
+        info = [
+            'Record {} / {}'.format(position + 1, len(reader)),
+            'Next: {}'.format(OPNAMES.get(opcode, opcode)),
+            'Stack depth: {}'.format(depth),
+            'Playing x{}'.format(step) if playing else 'Paused',
+            '',
+            *HELP,
+        ]
+        drawer.send((ReplayFrame(code, lasti, stack), info, (position, playing, step)))
+
+        stdscr.timeout(1000 // 30 if playing else -1)
+        key = stdscr.getch()
+        if key == ord('q'):
+            break
+        elif key in moves:
+            position += moves[key]
+        elif key == curses.KEY_HOME:
+            position = 0
+        elif key == curses.KEY_END:
+            position = len(reader) - 1
+        elif key == ord(' '):
+            playing = not playing
+        elif key == ord('+'):
+            step *= 2
+        elif key == ord('-'):
+            step = max(step // 2, 1)
+        elif key == -1 and playing:
+            position += step
+            playing = position < len(reader) - 1
+        position = min(max(position, 0), len(reader) - 1)
+    reader.close()
@@ -1,6 +1,8 @@
 import curses
 import dis
 import locale
+import weakref
+from collections import deque
 from types import CodeType
 
 from src.frame import Frame
@@ -97,6 +99,31 @@ def write_content(scr: curses.window, title: str, contents: list[str], curr: int
         scr.addstr(i, width - 1, '|')
 
 
+class Disassembly:
+    # 每个代码对象只格式化一次，高亮行也预先生成
+    def __init__(self, code: CodeType) -> None:
+        self.lines = []
+        self.marked = []
+        self.index_of = {}
+        for i, instr in enumerate(dis.Bytecode(code)):
+            self.index_of[instr.offset] = i
+            self.lines.append('{:>2}   {:<20} {}({})'.format(
+                instr.offset, instr.opname, instr.arg, instr.argval))
+            self.marked.append('{:>2} ->{:<20} {}({})'.format(
+                instr.offset, instr.opname, instr.arg, instr.argval))
+
+
+_disassemblies: 'weakref.WeakKeyDictionary[CodeType, Disassembly]' = weakref.WeakKeyDictionary()
+
+
+def get_disassembly(code: CodeType) -> Disassembly:
+    try:
+        return _disassemblies[code]
+    except KeyError:
+        disassembly = _disassemblies[code] = Disassembly(code)
+        return disassembly
+
+
 def draw(stdscr: curses.window):
     # Clear and refresh the screen for a blank canvas
     stdscr.clear()
@@ -110,35 +137,50 @@ def draw(stdscr: curses.window):
 
     color_blue = curses.color_pair(1)
 
+    # 上一次绘制的内容，没有变化的面板不重绘
+    size = code = None
+    last_stack = last_instr = last_output_count = None
     while True:
         # Initialization
         frame: Frame
-        outputs: list[str]
-        frame, outputs = yield
-        stdscr.clear()
-        height, width = stdscr.getmaxyx()
-
-        code_scr_height = write_code(stdscr, frame.code)
-        body_height = height - code_scr_height - 4
-
-        stack_scr = stdscr.derwin(body_height, width // 3, code_scr_height + 1, 0)
-        instr_scr = stdscr.derwin(body_height, width // 3, code_scr_height + 1, width // 3)
-        output_scr = stdscr.derwin(body_height, width // 3, code_scr_height + 1, width // 3 * 2)
-
-        write_content(stack_scr, 'Stack', [str(x) for x in frame.stack])
-        bytecode = dis.Bytecode(frame.code)
-
-        instructions = []
-        index = frame.f_lasti - 2
-        for i, instr in enumerate(bytecode):
-            if i * 2 == index:
-                instructions.append('{:>2} ->{:<20} {}({})'.format(
-                    instr.offset, instr.opname, instr.arg, instr.argval))
-            else:
-                instructions.append('{:>2}   {:<20} {}({})'.format(
-                    instr.offset, instr.opname, instr.arg, instr.argval))
-        write_content(
-            instr_scr, 'Instuctions', instructions, curr=index // 2, color=color_blue)
-        write_content(output_scr, 'Output', outputs, curr=len(outputs) - 1)
+        outputs: deque[str]
+        frame, outputs, output_count = yield
+        if stdscr.getmaxyx() != size or frame.f_code is not code:
+            size, code = stdscr.getmaxyx(), frame.f_code
+            height, width = size
+            stdscr.erase()
+            code_scr_height = write_code(stdscr, code)
+            body_height = height - code_scr_height - 4
+
+            stack_scr = stdscr.derwin(body_height, width // 3, code_scr_height + 1, 0)
+            instr_scr = stdscr.derwin(body_height, width // 3, code_scr_height + 1, width // 3)
+            output_scr = stdscr.derwin(body_height, width // 3, code_scr_height + 1, width // 3 * 2)
+            disassembly = get_disassembly(code)
+            last_stack = last_instr = last_output_count = None
+
+        stack = [str(x) for x in frame.f_stack]
+        if stack != last_stack:
+            last_stack = stack
+            stack_scr.erase()
+            write_content(stack_scr, 'Stack', stack)
+
+        # f_lasti 是下一条指令的下标，高亮上一条已执行的指令
+        offset = frame.f_code_info.offsets[frame.f_lasti - 1] if frame.f_lasti else -1
+        curr = disassembly.index_of.get(offset, 0)
+        if curr != last_instr:
+            last_instr = curr
+            instructions = disassembly.lines.copy()
+            instructions[curr] = disassembly.marked[curr]
+            instr_scr.erase()
+            write_content(
+                instr_scr, 'Instuctions', instructions, curr=curr, color=color_blue)
+
+        if output_count != last_output_count:
+            last_output_count = output_count
+            # 只取能显示的最后几行
+            visible = body_height - 5
+            lines = list(outputs)[-visible:] if visible > 0 else []
+            output_scr.erase()
+            write_content(output_scr, 'Output', lines, curr=len(lines) - 1)
 
         stdscr.refresh()
@@ -0,0 +1,52 @@
+import linecache
+import traceback
+from types import CodeType
+
+from src.codeinfo import get_code_info
+
+
+def line_of(code: CodeType, index: int) -> int:
+    offset = get_code_info(code).offsets[index]
+    for start, end, line in code.co_lines():
+        if start <= offset < end and line is not None:
+            return line
+    return code.co_firstlineno
+
+
+def record(exc: BaseException, code: CodeType, index: int):
+    # 异常每离开或经过一个 VM 帧记录一次 (代码对象, 指令下标)，从内到外。
+    # 行号只在显示时才从 co_lines 计算，被捕获的异常只付出追加一个元组的代价
+    try:
+        exc._vm_traceback.append((code, index))
+    except AttributeError:
+        exc._vm_traceback = [(code, index)]
+
+
+def extract(exc: BaseException) -> list[tuple[str, int, str]]:
+    # 从最外层到最内层的 (文件名, 行号, 函数名)
+    entries = getattr(exc, '_vm_traceback', ())
+    return [(code.co_filename, line_of(code, index), code.co_name) for code, index in reversed(entries)]
+
+
+def format_exception(exc: BaseException, _seen: set = None) -> list[str]:
+    # 与 traceback.format_exception 格式相同，调用栈换成 VM 的帧
+    seen = _seen if _seen is not None else set()
+    seen.add(id(exc))
+    lines = []
+    cause, context = exc.__cause__, exc.__context__
+    if cause is not None and id(cause) not in seen:
+        lines += format_exception(cause, seen)
+        lines.append('\nThe above exception was the direct cause of the following exception:\n\n')
+    elif context is not None and not exc.__suppress_context__ and id(context) not in seen:
+        lines += format_exception(context, seen)
+        lines.append('\nDuring handling of the above exception, another exception occurred:\n\n')
+    entries = extract(exc)
+    if entries:
+        lines.append('Traceback (most recent call last):\n')
+        for filename, lineno, name in entries:
+            lines.append('  File "{}", line {}, in {}\n'.format(filename, lineno, name))
+            line = linecache.getline(filename, lineno).strip()
+            if line:
+                lines.append('    {}\n'.format(line))
+    lines += traceback.format_exception_only(type(exc), exc)
+    return lines